@@ -0,0 +1,264 @@
+"""
+In-process stand-ins for the parts of Red and discord.py that VoteMember touches.
+
+They keep just enough state for the cog to run its real code paths and never
+go near the network. Every Discord call counts towards `FakeGuild.api_calls`
+and can be given an artificial latency.
+"""
+import asyncio
+import copy
+import itertools
+import types
+from typing import Any, Dict, List, Optional
+
+# snowflakes grow with time, the vote store relies on it to know the oldest vote
+_snowflakes = itertools.count(10 ** 17)
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+class FakeValue:
+    def __init__(self, data: Dict[str, Any], key: str):
+        self._data = data
+        self._key = key
+
+    async def __call__(self) -> Any:
+        return copy.deepcopy(self._data[self._key])
+
+    async def set(self, value: Any) -> None:
+        self._data[self._key] = copy.deepcopy(value)
+
+
+class FakeGroup:
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    async def all(self) -> Dict[str, Any]:
+        return copy.deepcopy(self._data)
+
+    def get_attr(self, key: str) -> FakeValue:
+        return FakeValue(self._data, key)
+
+    def __getattr__(self, key: str) -> FakeValue:
+        return FakeValue(self._data, key)
+
+
+class FakeConfig:
+    """
+    Red's Config without the JSON driver, values are deep copied like the real one does.
+    """
+
+    def __init__(self):
+        self._guild_defaults: Dict[str, Any] = {}
+        self._global: Dict[str, Any] = {}
+        self._guilds: Dict[int, Dict[str, Any]] = {}
+        self.reads = 0
+
+    @classmethod
+    def get_conf(cls, cog, identifier: int, **kwargs) -> "FakeConfig":
+        return cls()
+
+    def register_guild(self, **defaults) -> None:
+        self._guild_defaults.update(defaults)
+
+    def register_global(self, **defaults) -> None:
+        for key, value in defaults.items():
+            self._global.setdefault(key, value)
+
+    def guild(self, guild) -> FakeGroup:
+        self.reads += 1
+        data = self._guilds.get(guild.id)
+        if data is None:
+            data = self._guilds[guild.id] = copy.deepcopy(self._guild_defaults)
+        return FakeGroup(data)
+
+    def __getattr__(self, key: str) -> FakeValue:
+        if key.startswith("_"):
+            raise AttributeError(key)
+        return FakeValue(self._global, key)
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", position: int):
+        self.id = snowflake()
+        self.guild = guild
+        self.position = position
+        self.name = f"role{position}"
+        self.mention = f"<@&{self.id}>"
+
+    def __lt__(self, other: "FakeRole") -> bool:
+        return self.position < other.position
+
+
+class FakeReaction:
+    def __init__(self, guild: "FakeGuild", emoji: str, users: set):
+        self.guild = guild
+        self.emoji = emoji
+        self._users = users
+        self.me = False
+
+    @property
+    def count(self) -> int:
+        return len(self._users)
+
+    def users(self):
+        members = [self.guild.get_member(user_id) for user_id in self._users]
+        users = [
+            types.SimpleNamespace(id=user_id, bot=member is not None and member.bot)
+            for user_id, member in zip(self._users, members)
+        ]
+
+        class Iterator:
+            async def flatten(self):
+                return users
+
+        return Iterator()
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", content: Optional[str]):
+        self.id = snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self._reactions: Dict[str, set] = {}
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.guild.api_call()
+        self._reactions.setdefault(str(emoji), set())
+
+    async def clear_reaction(self, emoji: str) -> None:
+        await self.guild.api_call()
+        self._reactions.pop(str(emoji), None)
+
+    async def edit(self, content: Optional[str] = None, **kwargs) -> None:
+        await self.guild.api_call()
+        self.content = content
+
+    async def delete(self) -> None:
+        await self.guild.api_call()
+        self.channel.messages.pop(self.id, None)
+
+    @property
+    def reactions(self) -> List[FakeReaction]:
+        return [FakeReaction(self.guild, emoji, users) for emoji, users in self._reactions.items()]
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild"):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = "agreement"
+        self.mention = f"<#{self.id}>"
+        self.messages: Dict[int, FakeMessage] = {}
+        self.sent = 0
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        await self.guild.api_call()
+        message = self.post(content)
+        self.sent += 1
+        return message
+
+    def post(self, content: Optional[str] = None) -> FakeMessage:
+        """
+        Create a message without an API call, for setting up open votes in bulk.
+        """
+        message = FakeMessage(self, content)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages[message_id]
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.guild.api_call()
+        return self.messages[message_id]
+
+    def permissions_for(self, member) -> Any:
+        return types.SimpleNamespace(send_messages=True, embed_links=True)
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", bot: bool = False):
+        self.id = snowflake()
+        self.guild = guild
+        self.bot = bot
+        self.name = f"member{self.id}"
+        self.mention = f"<@{self.id}>"
+        self.roles: List[FakeRole] = []
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None) -> None:
+        await self.guild.api_call()
+        self.roles.extend(roles)
+
+
+class FakeGuild:
+    def __init__(self, api_latency: float = 0.0):
+        self.id = snowflake()
+        self.name = "benchmark"
+        self.api_latency = api_latency
+        self.api_calls = 0
+        self.roles = [FakeRole(self, position) for position in range(1, 4)]
+        self.channel = FakeChannel(self)
+        self.members: Dict[int, FakeMember] = {}
+        self.me = FakeMember(self, bot=True)
+        self.me.guild_permissions = types.SimpleNamespace(manage_roles=True)
+
+    async def api_call(self) -> None:
+        self.api_calls += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    def join(self) -> FakeMember:
+        member = FakeMember(self)
+        self.members[member.id] = member
+        return member
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        for role in self.roles:
+            if role.id == role_id:
+                return role
+        return None
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channel if channel_id == self.channel.id else None
+
+
+class FakeReactionEvent:
+    """
+    The attributes of discord.RawReactionActionEvent the cog reads.
+    """
+
+    __slots__ = ("message_id", "channel_id", "guild_id", "user_id", "emoji", "member", "event_type")
+
+    def __init__(self, message: FakeMessage, user: FakeMember, emoji: str, event_type: str = "REACTION_ADD"):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id
+        self.user_id = user.id
+        self.emoji = emoji
+        # discord.py only sends the member along with added reactions
+        self.member = user if event_type == "REACTION_ADD" else None
+        self.event_type = event_type
+
+
+class FakeBot:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.user = types.SimpleNamespace(id=snowflake())
+        self.guilds: Dict[int, FakeGuild] = {}
+
+    def add_guild(self, guild: FakeGuild) -> FakeGuild:
+        self.guilds[guild.id] = guild
+        return guild
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    async def wait_until_red_ready(self) -> None:
+        pass
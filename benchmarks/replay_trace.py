@@ -0,0 +1,240 @@
+"""
+Replay a votemember trace (see `votemember trace start`) against a local VoteMember.
+
+The events are fed to the cog's handlers one at a time in recorded order, either
+as fast as possible or spaced out like they were recorded, so a replay always
+makes the same decisions. Reactions that counted towards a vote are aimed at the
+agreement message the replayed cog posted for the same member, so digest
+grouping doesn't have to match the recording.
+
+Prints a JSON summary with the throughput and the outcomes that differ from
+the recording, and exits with status 1 if any do:
+
+    python benchmarks/replay_trace.py trace.jsonl.gz --timing original --speed 4
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakes import FakeBot, FakeConfig, FakeGuild, FakeMember, FakeMessage, FakeReactionEvent, FakeRole  # noqa: E402
+
+import votemember.votemember as vm  # noqa: E402
+from votemember.backend import BACKENDS  # noqa: E402
+
+# trace guild, trace user
+TraceMember = Tuple[int, int]
+
+
+def read_trace(path: Path) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Replay:
+    def __init__(self, bot: FakeBot, cog: vm.VoteMember, fast: bool, api_latency: float):
+        self.bot = bot
+        self.cog = cog
+        self.fast = fast
+        self.api_latency = api_latency
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.members: Dict[TraceMember, FakeMember] = {}
+        # messages reacted to that weren't open votes in the recording
+        self.messages: Dict[Tuple[int, int], FakeMessage] = {}
+        self.weight_roles: Dict[Tuple[int, float], FakeRole] = {}
+        # members whose whole vote is in the trace, only their outcomes can be compared
+        self.joined: List[TraceMember] = []
+        self.expected: Dict[TraceMember, str] = {}
+        self.events: Counter = Counter()
+        self.unmatched = 0
+
+    def guild(self, trace_id: int) -> FakeGuild:
+        guild = self.guilds.get(trace_id)
+        if guild is None:
+            guild = self.guilds[trace_id] = self.bot.add_guild(FakeGuild(self.api_latency))
+        return guild
+
+    def member(self, trace_guild: int, trace_user: int) -> FakeMember:
+        member = self.members.get((trace_guild, trace_user))
+        if member is None:
+            guild = self.guild(trace_guild)
+            member = self.members[trace_guild, trace_user] = FakeMember(guild)
+            # users seen before they join were members when the recording started
+            guild.members[member.id] = member
+        return member
+
+    async def weight_role(self, guild: FakeGuild, trace_guild: int, weight: float) -> FakeRole:
+        role = self.weight_roles.get((trace_guild, weight))
+        if role is None:
+            role = self.weight_roles[trace_guild, weight] = FakeRole(guild, len(guild.roles) + 1)
+            guild.roles.append(role)
+            weights = dict((await self.cog._get_settings(guild))["VOTE_WEIGHTS"])
+            weights[str(role.id)] = weight
+            await self.cog._set_setting(guild, "VOTE_WEIGHTS", weights)
+        return role
+
+    async def settings(self, record: Dict[str, Any]) -> None:
+        guild = self.guild(record["g"])
+        values = {key: record[key] for key in vm.default_settings if key in record}
+        values["ROLE"] = [guild.roles[0].id]
+        values["AGREE_CHANNEL"] = guild.channel.id if record["channel"] else None
+        values["POSITIVE_REACT"] = record["positive"]
+        values["NEGATIVE_REACT"] = record["negative"]
+        if self.fast:
+            # digests are sent on a timer, which a replay at full speed doesn't wait for
+            values["DIGEST_THRESHOLD"] = 0
+        await self.cog._get_settings(guild)
+        for key, value in values.items():
+            await self.cog._set_setting(guild, key, value)
+
+    async def reaction(self, record: Dict[str, Any]) -> None:
+        trace_guild = record["g"]
+        guild = self.guild(trace_guild)
+        voter = self.member(trace_guild, record["u"])
+        voter.bot = bool(record.get("bot"))
+        added = record["e"] == "+"
+        message = None
+        if "v" in record:
+            target = self.members.get((trace_guild, record["v"]))
+            vote = await self.cog.votes.for_member(guild.id, target.id) if target is not None else None
+            if vote is None:
+                self.unmatched += 1
+            else:
+                positive = bool(record["p"])
+                if vote.slot:
+                    emoji = (vm.DIGEST_NUMBERS if positive else vm.DIGEST_LETTERS)[vote.slot - 1]
+                else:
+                    emoji = self.cog._settings[guild.id]["POSITIVE_REACT" if positive else "NEGATIVE_REACT"]
+                message = guild.channel.messages[vote.message_id]
+                if "w" in record:
+                    role = await self.weight_role(guild, trace_guild, record["w"])
+                    if role not in voter.roles:
+                        voter.roles.append(role)
+        if message is None:
+            message = self.messages.get((trace_guild, record["m"]))
+            if message is None:
+                message = self.messages[trace_guild, record["m"]] = guild.channel.post()
+            emoji = record["r"]
+        event = FakeReactionEvent(message, voter, emoji, "REACTION_ADD" if added else "REACTION_REMOVE")
+        if added:
+            await self.cog.on_raw_reaction_add(event)
+        else:
+            await self.cog.on_raw_reaction_remove(event)
+
+    async def handle(self, record: Dict[str, Any]) -> None:
+        kind = record["e"]
+        if kind == "s":
+            await self.settings(record)
+        elif kind == "j":
+            self.joined.append((record["g"], record["u"]))
+            member = self.member(record["g"], record["u"])
+            await self.cog.on_member_join(member)
+        elif kind == "l":
+            member = self.member(record["g"], record["u"])
+            self.guild(record["g"]).members.pop(member.id, None)
+            await self.cog.on_member_remove(member)
+        elif kind in "+-":
+            await self.reaction(record)
+        elif kind == "o":
+            self.expected[record["g"], record["u"]] = record["r"]
+            return
+        else:
+            return
+        self.events[kind] += 1
+
+    async def outcomes(self) -> Dict[TraceMember, str]:
+        by_id = {(self.guilds[g].id, member.id): (g, u) for (g, u), member in self.members.items()}
+        results = {}
+        for guild in self.guilds.values():
+            # oldest first, so a member voted on twice ends up with the last outcome
+            for event in reversed(await self.cog.audit.history(guild.id, limit=10 ** 9)):
+                if event.event in ("voted_in", "voted_out"):
+                    results[by_id[guild.id, event.member_id]] = "in" if event.event == "voted_in" else "out"
+        return results
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    vm.Config = FakeConfig
+    records = list(read_trace(args.trace))
+    header = records[0] if records and records[0].get("e") == "h" else {}
+    with tempfile.TemporaryDirectory(prefix="votemember-replay-") as tmp:
+        vm.cog_data_path = lambda cog: Path(tmp)
+        bot = FakeBot()
+        cog = vm.VoteMember(bot)
+        cog.config._global["VOTE_BACKEND"] = args.backend
+        await cog._backend()
+        replay = Replay(bot, cog, args.timing == "fast", args.api_latency / 1000)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        busy = 0.0
+        behind = 0.0
+        for record in records:
+            if args.timing == "original":
+                delay = start + record.get("t", 0) / 1000 / args.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    behind = max(behind, -delay)
+            handled = time.perf_counter()
+            await replay.handle(record)
+            busy += time.perf_counter() - handled
+        elapsed = loop.time() - start
+
+        actual = await replay.outcomes()
+        cog.cog_unload()
+        await asyncio.sleep(0.05)
+
+    mismatches = []
+    for trace_member in replay.joined:
+        expected = replay.expected.get(trace_member, "open")
+        got = actual.get(trace_member, "open")
+        if expected != got:
+            mismatches.append({"guild": trace_member[0], "user": trace_member[1], "expected": expected, "got": got})
+    handled_events = sum(replay.events.values())
+    return {
+        "trace": str(args.trace),
+        "trace_version": header.get("version"),
+        "timing": args.timing,
+        "speed": args.speed if args.timing == "original" else None,
+        "backend": args.backend,
+        "events": dict(replay.events),
+        "elapsed_s": elapsed,
+        "events_per_s": handled_events / elapsed if elapsed else None,
+        "handler_events_per_s": handled_events / busy if busy else None,
+        "max_behind_ms": behind * 1000,
+        "unmatched_votes": replay.unmatched,
+        "votes_compared": len(replay.joined),
+        "mismatches": mismatches,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("--timing", choices=("fast", "original"), default="fast")
+    parser.add_argument("--speed", type=float, default=1.0, help="how many times faster than recorded, with original timing")
+    parser.add_argument("--backend", choices=BACKENDS, default="memory")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="milliseconds each Discord call takes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["mismatches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
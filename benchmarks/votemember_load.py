@@ -0,0 +1,261 @@
+"""
+Synthetic load benchmark for VoteMember.
+
+Drives the cog's real handlers against the stand-ins in fakes.py, so it needs
+Red and discord.py installed but no network. For every scale (number of open
+votes) and backend it measures:
+
+- reactions per second through on_raw_reaction_add and on_raw_reaction_remove
+- how long the reaction that finishes a vote takes, including the role grant
+- joins per second through on_member_join, with and without digest messages
+- traced Python memory per pending vote in the in-memory store
+
+Results are written as JSON lines, one record per benchmark and scale, after
+a first record describing the run:
+
+    python benchmarks/votemember_load.py --scales 10 1000 100000 --output run.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakes import FakeBot, FakeConfig, FakeGuild, FakeReactionEvent, snowflake  # noqa: E402
+
+import votemember.votemember as vm  # noqa: E402
+from votemember.backend import BACKENDS, MemoryBackend  # noqa: E402
+from votemember.votes import PendingVote  # noqa: E402
+
+DEFAULT_SCALES = (10, 100, 1000, 10000, 100000)
+# distinct members reacting in the reaction benchmark
+VOTERS = 500
+# settings every benchmark guild starts from, votes never finish unless a benchmark lowers the quorum
+BASE_SETTINGS = {"ENABLED": True, "POSITIVE_NEEDED": 10 ** 9, "NEGATIVE_NEEDED": 10 ** 9}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def at(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": at(0.5) * 1000,
+        "p95_ms": at(0.95) * 1000,
+        "p99_ms": at(0.99) * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+class Harness:
+    """
+    One VoteMember cog in one fake guild, with its data in a temporary folder.
+    """
+
+    def __init__(self, backend: str, api_latency: float):
+        self.backend = backend
+        self.api_latency = api_latency
+
+    async def __aenter__(self) -> "Harness":
+        self._tmp = tempfile.TemporaryDirectory(prefix="votemember-bench-")
+        vm.cog_data_path = lambda cog: Path(self._tmp.name)
+        self.bot = FakeBot()
+        self.guild = self.bot.add_guild(FakeGuild(self.api_latency))
+        self.cog = vm.VoteMember(self.bot)
+        self.cog.config._global["VOTE_BACKEND"] = self.backend
+        await self.configure(ROLE=[self.guild.roles[0].id], AGREE_CHANNEL=self.guild.channel.id, **BASE_SETTINGS)
+        await self.cog._backend()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.cog.cog_unload()
+        # let cancelled tasks and the database threads finish before the folder goes
+        await asyncio.sleep(0.05)
+        self._tmp.cleanup()
+
+    async def configure(self, **settings) -> None:
+        for key, value in settings.items():
+            await self.cog._set_setting(self.guild, key, value)
+        await self.cog._get_settings(self.guild)
+
+    async def open_votes(self, count: int) -> List[PendingVote]:
+        """
+        Open `count` single member votes at once, without going through on_member_join.
+        """
+        channel = self.guild.channel
+        expires_at = time.time() + vm.default_settings["VOTE_TTL"]
+        votes = [
+            PendingVote(channel.post().id, channel.id, self.guild.id, self.guild.join().id, expires_at=expires_at)
+            for _ in range(count)
+        ]
+        await self.cog._track_votes(votes)
+        return votes
+
+    def counters(self) -> Dict[str, int]:
+        return {"api_calls": self.guild.api_calls, "config_reads": self.cog.config.reads}
+
+
+async def bench_reactions(harness: Harness, votes: List[PendingVote], reactions: int) -> Dict[str, Any]:
+    rng = random.Random(0)
+    guild = harness.guild
+    voters = [guild.join() for _ in range(VOTERS)]
+    events = [
+        FakeReactionEvent(guild.channel.messages[rng.choice(votes).message_id], voters[index % VOTERS], "✅")
+        for index in range(reactions)
+    ]
+    removals = [
+        FakeReactionEvent(guild.channel.messages[event.message_id], voters[index % VOTERS], "✅", "REACTION_REMOVE")
+        for index, event in enumerate(events)
+    ]
+    # reactions that can't be votes, they should be dropped before any I/O
+    ignored = [
+        FakeReactionEvent(guild.channel.messages[event.message_id], voters[index % VOTERS], "🎉")
+        for index, event in enumerate(events)
+    ]
+
+    results = {}
+    for name, batch, handler in (
+        ("add", events, harness.cog.on_raw_reaction_add),
+        ("remove", removals, harness.cog.on_raw_reaction_remove),
+        ("ignored", ignored, harness.cog.on_raw_reaction_add),
+    ):
+        start = time.perf_counter()
+        for event in batch:
+            await handler(event)
+        elapsed = time.perf_counter() - start
+        results[f"{name}_per_s"] = len(batch) / elapsed if elapsed else None
+    results["reactions"] = reactions
+    return results
+
+
+async def bench_finalise(harness: Harness, votes: List[PendingVote], count: int) -> Dict[str, Any]:
+    await harness.configure(POSITIVE_NEEDED=1)
+    guild = harness.guild
+    voter = guild.join()
+    latencies = []
+    for vote in votes[:count]:
+        event = FakeReactionEvent(guild.channel.messages[vote.message_id], voter, "✅")
+        start = time.perf_counter()
+        await harness.cog.on_raw_reaction_add(event)
+        latencies.append(time.perf_counter() - start)
+    await harness.configure(POSITIVE_NEEDED=BASE_SETTINGS["POSITIVE_NEEDED"])
+    return {"finished": len(latencies), **percentiles(latencies)}
+
+
+async def bench_joins(harness: Harness, joins: int) -> Dict[str, Any]:
+    results = {}
+    for name, threshold in (("single", 0), ("digest", 5)):
+        await harness.configure(DIGEST_THRESHOLD=threshold, DIGEST_WINDOW=60)
+        members = [harness.guild.join() for _ in range(joins)]
+        start = time.perf_counter()
+        for member in members:
+            await harness.cog.on_member_join(member)
+        elapsed = time.perf_counter() - start
+        results[f"{name}_per_s"] = joins / elapsed if elapsed else None
+        for task in harness.cog._digest_tasks.values():
+            task.cancel()
+        harness.cog._digest_tasks.clear()
+        harness.cog._digest_members.clear()
+        harness.cog._joins.clear()
+    results["joins"] = joins
+    return results
+
+
+async def bench_memory(scale: int) -> Dict[str, Any]:
+    """
+    Traced Python memory of `scale` pending votes in the in-memory store, without a database behind it.
+    """
+    channel_id, guild_id = snowflake(), snowflake()
+    expires_at = time.time() + vm.default_settings["VOTE_TTL"]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    backend = MemoryBackend(scale)
+    await backend.add(
+        [PendingVote(snowflake(), channel_id, guild_id, snowflake(), expires_at=expires_at) for _ in range(scale)]
+    )
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del backend
+    return {"bytes_per_vote": used / scale}
+
+
+async def run(args: argparse.Namespace, emit) -> None:
+    vm.Config = FakeConfig
+    # the cap would evict votes at the larger scales
+    vm.MAX_PENDING_VOTES = max(args.scales) + args.joins * 2 + 1
+    emit(
+        {
+            "benchmark": "run",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.time(),
+            "backends": args.backends,
+            "scales": args.scales,
+            "api_latency_ms": args.api_latency,
+        }
+    )
+    for scale in args.scales:
+        emit({"benchmark": "memory", "backend": "memory", "scale": scale, **await bench_memory(scale)})
+        for backend in args.backends:
+            print(f"{backend} backend, {scale} open votes", file=sys.stderr)
+            async with Harness(backend, args.api_latency / 1000) as harness:
+                votes = await harness.open_votes(scale)
+                for name, bench in (
+                    ("reactions", bench_reactions(harness, votes, args.reactions)),
+                    ("finalise", bench_finalise(harness, votes, min(args.finalise, scale))),
+                    ("joins", bench_joins(harness, args.joins)),
+                ):
+                    before = harness.counters()
+                    result = await bench
+                    after = harness.counters()
+                    emit(
+                        {
+                            "benchmark": name,
+                            "backend": backend,
+                            "scale": scale,
+                            **result,
+                            **{key: after[key] - before[key] for key in after},
+                        }
+                    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="numbers of open votes")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["memory"])
+    parser.add_argument("--reactions", type=int, default=5000, help="reactions fired per scale")
+    parser.add_argument("--finalise", type=int, default=200, help="votes finished per scale")
+    parser.add_argument("--joins", type=int, default=1000, help="members joining per scale and mode")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="milliseconds each Discord call takes")
+    parser.add_argument("--output", type=Path, help="JSON lines file, stdout if not given")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    out = args.output.open("w") if args.output else sys.stdout
+
+    def emit(record: Dict[str, Any]) -> None:
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    try:
+        asyncio.run(run(args, emit))
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
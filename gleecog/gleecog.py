@@ -1,26 +1,483 @@
-from redbot.core import commands
-import discord
-import sys
-from random import choice
-import random
-import json
-
-folderPath = "/home/bastion/red_data/cogs/CogManager/cogs/gleecog/"
-
-class Gleecog(commands.Cog):
-
-    def __init__(self, bot):
-        self.bot = bot
-
-    @commands.command(name="quote", aliases=["q"])
-    async def quote(self, ctx):
-        """Picks a random quote"""
-
-        with open("quotes.json") as f:
-            data = json.load(f)
-
-
-        #with open(folderPath + 'quotes.json', 'r', encoding='utf-8') as qList:
-        #    quoteList = qList.readlines()
-        #    pick = random.randint(0,len(quoteList)-1)
-        await ctx.send(data[0]['test'])
\ No newline at end of file
+from redbot.core import Config, checks, commands
+import discord
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, pagify
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+from pathlib import Path
+from array import array
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from .importer import ImportResult, import_quotes, iter_json_array, normalise
+from .index import QuoteIndex
+from .store import MmapQuoteStore, QuoteStore
+from .watchdog import LoopWatchdog
+
+log = logging.getLogger("red.GleeCog.gleecog")
+
+# shipped with the cog, copied into the data path the first time the cog loads
+BUNDLED_QUOTES = Path(__file__).parent / "quotes.json"
+
+# "json" keeps quotes.json parsed in memory, "mmap" reads quotes.txt (one quote per line) from a memory map
+STORAGE_MODES = ("json", "mmap")
+
+default_global = {
+    "STORAGE": "json",
+    # seconds between checks of the quote file for changes, 0 disables reloading
+    "RELOAD_INTERVAL": 30,
+    # build the search index in mmap mode too, it holds every word of the corpus in memory
+    "MMAP_SEARCH": False,
+    # watch the event loop for blocking calls, shared by every cog on the bot
+    "WATCHDOG": False,
+    # seconds the loop has to be blocked for it to count as a stall
+    "WATCHDOG_THRESHOLD": 0.25,
+}
+
+# quotes written to the store per batch during an import
+IMPORT_BATCH_SIZE = 1000
+# records between progress reports during an import
+IMPORT_PROGRESS_EVERY = 50000
+
+# stalls kept for loopwatch
+WATCHDOG_HISTORY = 20
+
+class Gleecog(commands.Cog):
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = Config.get_conf(self, 1234123413)
+        self.config.register_global(**default_global)
+        self.data_path = cog_data_path(self)
+        self.store = QuoteStore()
+        # None while search is off for mmap storage
+        self.index: Optional[QuoteIndex] = QuoteIndex()
+        # storage mode and (path, size, mtime) of the file the current store was read from
+        self._storage = None
+        self._loaded_key = None
+        # set once the first load is done, reloads swap the snapshot without making commands wait
+        self._loaded = asyncio.Event()
+        self._reload_lock = asyncio.Lock()
+        # set by quoteset interval so the watcher doesn't finish sleeping the old interval first
+        self._interval_changed = asyncio.Event()
+        self._import_lock = asyncio.Lock()
+        self._load_task = self.bot.loop.create_task(self._initial_load())
+        self._watch_task = self.bot.loop.create_task(self._watch_quotes())
+        self.watchdog: Optional[LoopWatchdog] = None
+        self._watchdog_task = self.bot.loop.create_task(self._start_watchdog())
+
+    def cog_unload(self):
+        self._load_task.cancel()
+        self._watch_task.cancel()
+        self._watchdog_task.cancel()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.store.close()
+
+    async def _start_watchdog(self):
+        if await self.config.WATCHDOG():
+            threshold = await self.config.WATCHDOG_THRESHOLD()
+            self.watchdog = LoopWatchdog(self.bot.loop, threshold, history=WATCHDOG_HISTORY)
+
+    def _quote_path(self, storage: str) -> Path:
+        return self.data_path / ("quotes.txt" if storage == "mmap" else "quotes.json")
+
+    @staticmethod
+    def _file_key(path: Path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def _read_quotes(self, storage: str, search: bool):
+        quote_path = self._quote_path(storage)
+        if storage == "json" and not quote_path.exists():
+            shutil.copyfile(BUNDLED_QUOTES, quote_path)
+        # taken before reading, a change made mid-read just triggers another reload
+        key = self._file_key(quote_path)
+        if storage == "mmap":
+            store = MmapQuoteStore(quote_path)
+        else:
+            store = QuoteStore.from_json(quote_path)
+        index = QuoteIndex.build(store) if storage == "json" or search else None
+        return store, index, key
+
+    def _seed_mmap(self, store) -> None:
+        """
+        Write the loaded quotes to quotes.txt, one per line, so mmap mode starts with them.
+        """
+        quote_path = self._quote_path("mmap")
+        tmp_path = quote_path.with_name(quote_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for i in range(len(store)):
+                f.write(normalise(store[i]) + "\n")
+        os.replace(tmp_path, quote_path)
+
+    async def _initial_load(self):
+        try:
+            await self._load_quotes(await self.config.STORAGE())
+        except Exception:
+            log.error("Error loading quotes from %s", self.data_path, exc_info=True)
+        finally:
+            self._loaded.set()
+
+    async def _load_quotes(self, storage: str):
+        """
+        Read the quote file in an executor and swap it in, errors are left to the caller.
+        """
+        async with self._reload_lock:
+            search = await self.config.MMAP_SEARCH()
+            store, index, key = await self.bot.loop.run_in_executor(None, self._read_quotes, storage, search)
+            # swapped without awaiting in between, so a command sees either the old or the new snapshot
+            old_store = self.store
+            self.store, self.index, self._storage, self._loaded_key = store, index, storage, key
+            old_store.close()
+
+    async def _watch_quotes(self):
+        await self._loaded.wait()
+        # file that failed to load, it isn't retried until it changes again
+        failed_key = None
+        while True:
+            interval = await self.config.RELOAD_INTERVAL()
+            try:
+                # no timeout while reloading is disabled, only a new interval wakes the watcher
+                await asyncio.wait_for(self._interval_changed.wait(), interval or None)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                self._interval_changed.clear()
+                continue
+            if self._import_lock.locked():
+                continue
+            async with self._import_lock:
+                # nothing is loaded when the first load failed, keep watching the configured file
+                storage = self._storage or await self.config.STORAGE()
+                path = self._quote_path(storage)
+                key = await self.bot.loop.run_in_executor(None, self._file_key, path)
+                if key is not None and key != self._loaded_key and key != failed_key:
+                    log.debug("%s changed, reloading quotes", path)
+                    try:
+                        await self._load_quotes(storage)
+                    except Exception:
+                        failed_key = key
+                        log.error("Error reloading quotes from %s", path, exc_info=True)
+
+    def _import_file(self, path: Path, storage: str, store, progress) -> Tuple[ImportResult, Any]:
+        """
+        Write the new quotes to the quote file, returns the result and what the store
+        needs to add them: the quotes for json, the offsets of their lines for mmap.
+        """
+        quote_path = self._quote_path(storage)
+        existing = (store[i] for i in range(len(store)))
+        if storage == "mmap":
+            offsets = array("Q")
+            with quote_path.open("a+b") as out:
+                # don't glue the first imported quote onto an unterminated last line
+                end = out.seek(0, os.SEEK_END)
+                if end:
+                    out.seek(-1, os.SEEK_END)
+                    if out.read(1) != b"\n":
+                        out.write(b"\n")
+                        end += 1
+
+                def write_batch(batch):
+                    nonlocal end
+                    lines = [text.encode("utf-8") + b"\n" for text in batch]
+                    for line in lines:
+                        offsets.append(end)
+                        end += len(line)
+                    out.write(b"".join(lines))
+                    out.flush()
+
+                result = import_quotes(
+                    path,
+                    existing,
+                    write_batch,
+                    batch_size=IMPORT_BATCH_SIZE,
+                    progress=progress,
+                    progress_every=IMPORT_PROGRESS_EVERY,
+                )
+            return result, offsets
+        # quotes.json can't be appended to, stream its entries as they are and then the new quotes into a copy
+        tmp_path = quote_path.with_name(quote_path.name + ".tmp")
+        added = []
+        try:
+            with tmp_path.open("w", encoding="utf-8") as out:
+                written = 0
+
+                def write_entry(entry):
+                    nonlocal written
+                    out.write(",\n" if written else "[\n")
+                    json.dump(entry, out, ensure_ascii=False)
+                    written += 1
+
+                with quote_path.open(encoding="utf-8") as f:
+                    for entry in iter_json_array(f):
+                        write_entry(entry)
+
+                def write_batch(batch):
+                    for text in batch:
+                        write_entry(text)
+                    out.flush()
+                    added.extend(batch)
+
+                result = import_quotes(
+                    path,
+                    existing,
+                    write_batch,
+                    batch_size=IMPORT_BATCH_SIZE,
+                    progress=progress,
+                    progress_every=IMPORT_PROGRESS_EVERY,
+                )
+                out.write("\n]\n" if written else "[]\n")
+        except BaseException:
+            tmp_path.unlink()
+            raise
+        if result.added:
+            os.replace(tmp_path, quote_path)
+        else:
+            tmp_path.unlink()
+        return result, added
+
+    def _extend_store(self, storage: str, store, index: Optional[QuoteIndex], added):
+        """
+        The store with the imported quotes appended, they are added to the live index as well.
+        """
+        key = self._file_key(self._quote_path(storage))
+        new_store = store.extended(added)
+        if index is not None:
+            # the new ids are past the end of the store commands are using, so they can't be found yet
+            for doc_id in range(len(store), len(new_store)):
+                index.add(doc_id, new_store[doc_id])
+        return new_store, key
+
+    async def import_quotes(
+        self, path: Path, progress: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> ImportResult:
+        """
+        Import quotes from a JSON array or JSONL file into the active store.
+
+        The file is streamed and parsed in an executor, quotes already in the store
+        are skipped. `progress` is awaited with a status line every
+        IMPORT_PROGRESS_EVERY records. The new quotes are appended to the loaded
+        store and search index, without reading the quote file again.
+        """
+        async with self._import_lock:
+            await self._loaded.wait()
+            storage = self._storage or await self.config.STORAGE()
+            loop = self.bot.loop
+
+            def report(result: ImportResult):
+                if progress is not None:
+                    asyncio.run_coroutine_threadsafe(progress(str(result)), loop)
+
+            result, added = await loop.run_in_executor(
+                None, self._import_file, path, storage, self.store, report
+            )
+            if not result.added:
+                return result
+            if self._storage != storage:
+                # nothing loaded to add to, the first load failed
+                await self._load_quotes(storage)
+                return result
+            async with self._reload_lock:
+                store, key = await loop.run_in_executor(
+                    None, self._extend_store, storage, self.store, self.index, added
+                )
+                old_store = self.store
+                self.store, self._loaded_key = store, key
+                old_store.close()
+            return result
+
+    @commands.group(name="quote", aliases=["q"], invoke_without_command=True)
+    async def quote(self, ctx):
+        """Picks a random quote"""
+        await self._loaded.wait()
+        quote = self.store.random()
+        if quote is None:
+            await ctx.send("There are no quotes yet.")
+            return
+        await ctx.send(quote)
+
+    @quote.command(name="search")
+    async def quote_search(self, ctx, *, terms: str):
+        """Picks a random quote containing all of the given words"""
+        await self._loaded.wait()
+        store, index = self.store, self.index
+        if index is None:
+            await ctx.send("Quote search is off for mmap storage, the bot owner can turn it on with `quoteset search`.")
+            return
+        # an import adds quotes to the index before the store holding them is swapped in
+        matches = [doc_id for doc_id in index.search(terms) if doc_id < len(store)]
+        if not matches:
+            await ctx.send("No quotes match that.")
+            return
+        await ctx.send(store[random.choice(matches)])
+
+    @commands.group(name="quoteset")
+    @checks.is_owner()
+    async def quoteset(self, ctx):
+        """Manage the quote store"""
+        pass
+
+    @quoteset.command(name="storage")
+    async def quoteset_storage(self, ctx, mode: str):
+        """
+        Choose how quotes are stored.
+        `json` keeps quotes.json in memory.
+        `mmap` memory-maps quotes.txt, one quote per line, for very large corpora.
+        """
+        mode = mode.lower()
+        if mode not in STORAGE_MODES:
+            await ctx.send("Storage mode must be one of: " + ", ".join(STORAGE_MODES))
+            return
+        if self._import_lock.locked():
+            await ctx.send("Quotes are being imported, try again once the import is done.")
+            return
+        # a reload closes the store an import is reading from
+        async with self._import_lock:
+            await self._loaded.wait()
+            seeded = False
+            if mode == "mmap" and self._storage == "json" and not self._quote_path(mode).exists():
+                await self.bot.loop.run_in_executor(None, self._seed_mmap, self.store)
+                seeded = True
+            try:
+                await self._load_quotes(mode)
+            except Exception as e:
+                log.error("Error loading %s quotes from %s", mode, self.data_path, exc_info=True)
+                await ctx.send(f"Couldn't load the {mode} quotes, storage is still {self._storage}: {e}")
+                return
+            await self.config.STORAGE.set(mode)
+            if seeded:
+                await ctx.send(f"Copied the {len(self.store)} quotes from quotes.json to quotes.txt.")
+            await ctx.send(f"Quote storage set to {mode}, {len(self.store)} quotes loaded.")
+
+    @quoteset.command(name="interval")
+    async def quoteset_interval(self, ctx, seconds: int):
+        """
+        Set how often the quote file is checked for changes, in seconds.
+        Use 0 to turn off automatic reloading.
+        """
+        if seconds < 0:
+            await ctx.send("The interval can't be negative.")
+            return
+        await self.config.RELOAD_INTERVAL.set(seconds)
+        self._interval_changed.set()
+        if seconds:
+            await ctx.send(f"The quote file will be checked for changes every {seconds} seconds.")
+        else:
+            await ctx.send("Automatic quote reloading disabled.")
+
+    @quoteset.command(name="search")
+    async def quoteset_search(self, ctx):
+        """
+        Turn quote search on or off for mmap storage.
+        The index keeps every word of the corpus in memory and is rebuilt on every reload.
+        json storage always has search.
+        """
+        if self._import_lock.locked():
+            await ctx.send("Quotes are being imported, try again once the import is done.")
+            return
+        async with self._import_lock:
+            enabled = not await self.config.MMAP_SEARCH()
+            await self.config.MMAP_SEARCH.set(enabled)
+            state = "on" if enabled else "off"
+            await self._loaded.wait()
+            if self._storage == "mmap":
+                try:
+                    await self._load_quotes("mmap")
+                except Exception as e:
+                    log.error("Error reloading quotes from %s", self.data_path, exc_info=True)
+                    await ctx.send(f"Quote search for mmap storage is now {state}, but reloading failed: {e}")
+                    return
+            await ctx.send(f"Quote search for mmap storage is now {state}.")
+
+    @quoteset.command(name="import")
+    async def quoteset_import(self, ctx, *, path: str):
+        """
+        Import quotes from a JSON array or JSONL file on the bot's machine.
+        Relative paths are looked up in the cog's data folder.
+        Quotes already in the store are skipped.
+        """
+        source = self.data_path / Path(path).expanduser()
+        if not source.is_file():
+            await ctx.send("That file doesn't exist.")
+            return
+        status = await ctx.send("Importing quotes...")
+
+        async def progress(line: str):
+            try:
+                await status.edit(content="Importing quotes... " + line)
+            except discord.HTTPException:
+                pass
+
+        try:
+            result = await self.import_quotes(source, progress)
+        except (OSError, ValueError) as e:
+            await ctx.send(f"Import failed: {e}")
+            return
+        await ctx.send(f"Import finished: {result}. {len(self.store)} quotes loaded.")
+
+    @commands.group(name="loopwatch", invoke_without_command=True)
+    @checks.is_owner()
+    async def loopwatch(self, ctx):
+        """
+        Show the latest times the event loop was blocked
+        Use `loopwatch stack <number>` to see what was running.
+        """
+        watchdog = self.watchdog
+        if watchdog is None:
+            await ctx.send("The loop watchdog is off, turn it on with `loopwatch toggle`.")
+            return
+        lines = [
+            f"Threshold {watchdog.threshold * 1000:g}ms, worst lag so far {watchdog.max_lag * 1000:.0f}ms",
+        ]
+        if not watchdog.stalls:
+            lines.append("No stalls yet.")
+        for number, stall in enumerate(reversed(watchdog.stalls), 1):
+            lines.append(f"{number}. <t:{int(stall.at)}:T> blocked {stall.lag * 1000:.0f}ms in {stall.where}")
+        for page in pagify("\n".join(lines)):
+            await ctx.send(page)
+
+    @loopwatch.command(name="stack")
+    async def loopwatch_stack(self, ctx, number: int = 1):
+        """Show the stack captured for a stall, 1 is the latest"""
+        stalls = list(reversed(self.watchdog.stalls)) if self.watchdog is not None else []
+        if not 0 < number <= len(stalls):
+            await ctx.send("There is no such stall.")
+            return
+        stall = stalls[number - 1]
+        if stall.stack is None:
+            await ctx.send("The loop got unblocked before its stack could be captured.")
+            return
+        for page in pagify(stall.stack, shorten_by=10):
+            await ctx.send(box(page, lang="py"))
+
+    @loopwatch.command(name="toggle")
+    async def loopwatch_toggle(self, ctx):
+        """Turn the loop watchdog on or off"""
+        enabled = self.watchdog is None
+        await self.config.WATCHDOG.set(enabled)
+        if enabled:
+            threshold = await self.config.WATCHDOG_THRESHOLD()
+            self.watchdog = LoopWatchdog(self.bot.loop, threshold, history=WATCHDOG_HISTORY)
+            await ctx.send("The loop watchdog is now on.")
+        else:
+            self.watchdog.stop()
+            self.watchdog = None
+            await ctx.send("The loop watchdog is now off.")
+
+    @loopwatch.command(name="threshold")
+    async def loopwatch_threshold(self, ctx, milliseconds: int):
+        """Set how long the loop has to be blocked for it to be recorded"""
+        if milliseconds <= 0:
+            await ctx.send("The threshold must be at least a millisecond.")
+            return
+        await self.config.WATCHDOG_THRESHOLD.set(milliseconds / 1000)
+        if self.watchdog is not None:
+            self.watchdog.threshold = milliseconds / 1000
+        await ctx.send(f"Stalls of {milliseconds}ms or more will now be recorded.")
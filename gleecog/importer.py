@@ -0,0 +1,181 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Set, TextIO
+
+from .store import quote_text
+
+# characters read from the source file at a time
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+WHITESPACE = " \t\r\n"
+# whitespace and what can still follow the part of a number read so far
+NUMBER_TAIL = WHITESPACE + ".eE+-0123456789"
+
+
+def normalise(text: str) -> str:
+    """
+    Collapse all whitespace, this also keeps every quote on a single line.
+    """
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def iter_json_array(f: TextIO) -> Iterator[Any]:
+    """
+    Yield the items of a top level JSON array one at a time without reading the whole file.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace() -> bool:
+        """
+        Move to the next non-whitespace character, False if the file ends first.
+        """
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return True
+            if not fill():
+                return False
+
+    if not skip_whitespace() or buffer[pos] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    if not skip_whitespace():
+        raise ValueError("Unterminated JSON array")
+    if buffer[pos] == "]":
+        pos += 1
+    else:
+        while True:
+            if buffer[pos] in ",]":
+                raise ValueError(f"Expected a value at {buffer[pos]!r}")
+            while True:
+                try:
+                    item, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+                    continue
+                # the rest of the buffer may be the rest of a number split across chunks, e.g. "1." of "1.5"
+                if not eof and not buffer[end:].strip(NUMBER_TAIL) and fill():
+                    continue
+                break
+            pos = end
+            yield item
+            if not skip_whitespace():
+                raise ValueError("Unterminated JSON array")
+            if buffer[pos] == "]":
+                pos += 1
+                break
+            if buffer[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' between items, got {buffer[pos]!r}")
+            pos += 1
+            if not skip_whitespace():
+                raise ValueError("Unterminated JSON array")
+    if skip_whitespace():
+        raise ValueError("Extra data after the JSON array")
+
+
+def iter_jsonl(f: TextIO) -> Iterator[Any]:
+    """
+    Yield one record per line, lines that aren't JSON are taken as plain text quotes.
+    """
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def iter_records(f: TextIO) -> Iterator[Any]:
+    """
+    Pick the parser from the first character, `[` means a JSON array, anything else JSONL.
+    """
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    f.seek(0)
+    if first == "[":
+        return iter_json_array(f)
+    return iter_jsonl(f)
+
+
+class ImportResult:
+    __slots__ = ("read", "added", "duplicates", "invalid")
+
+    def __init__(self):
+        self.read = 0
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.read} records read, {self.added} quotes added, "
+            f"{self.duplicates} duplicates and {self.invalid} invalid records skipped"
+        )
+
+
+def import_quotes(
+    path: Path,
+    existing: Iterable[str],
+    write_batch: Callable[[List[str]], None],
+    *,
+    batch_size: int = 1000,
+    progress: Optional[Callable[[ImportResult], None]] = None,
+    progress_every: int = 50000,
+) -> ImportResult:
+    """
+    Stream quotes from `path` and hand the new ones to `write_batch` in batches.
+
+    Quotes are normalised and deduplicated by content hash against `existing`
+    and against each other. This blocks, run it in an executor.
+    """
+    seen: Set[int] = {content_hash(normalise(text)) for text in existing}
+    result = ImportResult()
+    batch: List[str] = []
+    with path.open(encoding="utf-8") as f:
+        for record in iter_records(f):
+            result.read += 1
+            text = quote_text(record)
+            if text is None:
+                result.invalid += 1
+            else:
+                text = normalise(text)
+                digest = content_hash(text)
+                if digest in seen:
+                    result.duplicates += 1
+                else:
+                    seen.add(digest)
+                    batch.append(text)
+                    result.added += 1
+                    if len(batch) >= batch_size:
+                        write_batch(batch)
+                        batch = []
+            if progress is not None and result.read % progress_every == 0:
+                progress(result)
+    if batch:
+        write_batch(batch)
+    return result
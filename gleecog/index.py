@@ -0,0 +1,61 @@
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Set
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(TOKEN_RE.findall(text.casefold()))
+
+
+def _contains(postings: array, doc_id: int) -> bool:
+    i = bisect_left(postings, doc_id)
+    return i < len(postings) and postings[i] == doc_id
+
+
+class QuoteIndex:
+    """
+    Inverted index from lowercased word to the sorted ids of the quotes containing it.
+    Quotes must be added in increasing id order to keep the posting lists sorted.
+    """
+
+    __slots__ = ("_postings",)
+
+    def __init__(self):
+        self._postings: Dict[str, array] = {}
+
+    def add(self, doc_id: int, text: str) -> None:
+        for token in tokenize(text):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = array("I")
+            postings.append(doc_id)
+
+    @classmethod
+    def build(cls, store) -> "QuoteIndex":
+        """
+        Index every quote of a store, this blocks so run it in an executor.
+        """
+        index = cls()
+        for doc_id in range(len(store)):
+            index.add(doc_id, store[doc_id])
+        return index
+
+    def search(self, query: str) -> List[int]:
+        """
+        Ids of the quotes containing every word of the query.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        postings = []
+        for token in tokens:
+            found = self._postings.get(token)
+            if found is None:
+                return []
+            postings.append(found)
+        postings.sort(key=len)
+        smallest, rest = postings[0], postings[1:]
+        return [doc_id for doc_id in smallest if all(_contains(other, doc_id) for other in rest)]
@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+import random
+import struct
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, Optional, Tuple
+
+
+def quote_text(entry: Any) -> Optional[str]:
+    """
+    Turn one entry of quotes.json into the text that gets sent.
+    Entries can be plain strings or objects, objects use their "quote" key or their first value.
+    """
+    if isinstance(entry, dict):
+        entry = entry.get("quote", next(iter(entry.values()), None))
+    if not isinstance(entry, str):
+        return None
+    entry = entry.strip()
+    return entry or None
+
+
+class QuoteStore:
+    """
+    Every quote held in memory as one tuple of strings.
+    """
+
+    __slots__ = ("quotes",)
+
+    def __init__(self, quotes: Iterable[str] = ()):
+        self.quotes: Tuple[str, ...] = tuple(quotes)
+
+    def __len__(self) -> int:
+        return len(self.quotes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.quotes[index]
+
+    def random(self) -> Optional[str]:
+        if not self.quotes:
+            return None
+        return random.choice(self.quotes)
+
+    def extended(self, quotes: Iterable[str]) -> "QuoteStore":
+        """
+        A new store with `quotes` after the current ones, this store is left as it is.
+        """
+        return QuoteStore(self.quotes + tuple(quotes))
+
+    def close(self) -> None:
+        pass
+
+    @classmethod
+    def from_json(cls, path: Path) -> "QuoteStore":
+        """
+        Parse a quotes.json file, this blocks so run it in an executor.
+        """
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(text for text in map(quote_text, data) if text is not None)
+
+
+# size and mtime of the quote file the offsets were built from
+INDEX_HEADER = struct.Struct("<QQ")
+
+
+def build_offsets(data: mmap.mmap) -> array:
+    """
+    Start offset of every non-blank line in the map.
+    """
+    offsets = array("Q")
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = size
+        if data[start:end].strip():
+            offsets.append(start)
+        start = end + 1
+    return offsets
+
+
+class MmapQuoteStore:
+    """
+    Newline-delimited quotes read straight out of a memory map.
+
+    Only an array of line offsets is kept in memory, it is cached next to the
+    quote file as `<name>.idx` and rebuilt when the file's size or mtime changes.
+    Replace or append to the file rather than rewriting it in place, shrinking a
+    mapped file under a live store makes reads past the new end fault.
+    """
+
+    __slots__ = ("path", "_file", "_data", "_offsets")
+
+    def __init__(self, path: Path, offsets: Optional[array] = None):
+        """
+        `offsets` are the lines of the file when they are already known, they replace the cached index.
+        """
+        self.path = path
+        self._file = path.open("rb")
+        self._data: Optional[mmap.mmap] = None
+        self._offsets = array("Q")
+        stat = os.fstat(self._file.fileno())
+        if stat.st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if offsets is None:
+                self._offsets = self._load_index(stat)
+            else:
+                self._offsets = offsets
+                self._save_index(stat, offsets)
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".idx")
+
+    def _load_index(self, stat: os.stat_result) -> array:
+        key = (stat.st_size, stat.st_mtime_ns)
+        try:
+            raw = self.index_path.read_bytes()
+        except OSError:
+            raw = b""
+        if len(raw) >= INDEX_HEADER.size and INDEX_HEADER.unpack_from(raw) == key:
+            offsets = array("Q")
+            offsets.frombytes(raw[INDEX_HEADER.size :])
+            return offsets
+        offsets = build_offsets(self._data)
+        self._save_index(stat, offsets)
+        return offsets
+
+    def _save_index(self, stat: os.stat_result, offsets: array) -> None:
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(INDEX_HEADER.pack(stat.st_size, stat.st_mtime_ns))
+            offsets.tofile(f)
+        os.replace(tmp_path, self.index_path)
+
+    def extended(self, offsets: array) -> "MmapQuoteStore":
+        """
+        A new store over the file after lines were appended to it, `offsets` being
+        where they start. The file isn't scanned again, this store is left as it is.
+        """
+        return MmapQuoteStore(self.path, self._offsets + offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> str:
+        start = self._offsets[index]
+        end = self._data.find(b"\n", start)
+        if end == -1:
+            end = len(self._data)
+        return self._data[start:end].decode("utf-8", errors="replace").strip()
+
+    def random(self) -> Optional[str]:
+        if not self._offsets:
+            return None
+        return self[random.randrange(len(self._offsets))]
+
+    def close(self) -> None:
+        if self._data is not None:
+            self._data.close()
+        self._file.close()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Optional
+
+log = logging.getLogger("red.GleeCog.watchdog")
+
+# innermost frames kept of a blocked loop's stack
+STACK_DEPTH = 25
+
+
+class Stall:
+    __slots__ = ("at", "lag", "stack", "where")
+
+    def __init__(self, at: float, lag: float, stack: Optional[str] = None, where: str = "unknown"):
+        # wall clock time the loop stopped responding
+        self.at = at
+        # seconds the loop was blocked, final once the loop got back to the heartbeat
+        self.lag = lag
+        # what the loop thread was running, None if it got unblocked before the watchdog looked
+        self.stack = stack
+        # file, line and function the loop thread was in
+        self.where = where
+
+
+class LoopWatchdog:
+    """
+    Measures how late the event loop wakes up from a sleep and catches what blocks it.
+
+    A heartbeat task sleeps `interval` seconds at a time on the loop. A thread checks
+    when it last beat, and once that is `threshold` seconds overdue the loop is stuck
+    in synchronous code, so the thread copies the loop thread's stack right then.
+    The last `history` stalls are kept in `stalls`, newest last.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float, interval: float = 0.5, history: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[Stall] = deque(maxlen=history)
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        # stall the thread caught that the loop hasn't come back from yet
+        self._current: Optional[Stall] = None
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="gleecog-watchdog", daemon=True)
+        self._task = loop.create_task(self._heartbeat())
+
+    async def _heartbeat(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._thread.start()
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            with self._lock:
+                self._beat = now
+                stall, self._current = self._current, None
+                if stall is not None:
+                    stall.lag = lag
+                elif lag >= self.threshold:
+                    stall = Stall(time.time() - lag, lag)
+                    self.stalls.append(stall)
+            self.max_lag = max(self.max_lag, lag)
+            if stall is not None:
+                log.warning(
+                    "Event loop was blocked for %.3fs%s",
+                    stall.lag,
+                    ", in:\n" + stall.stack if stall.stack else "",
+                )
+
+    def _watch(self) -> None:
+        # the threshold can change while the watchdog runs
+        while not self._stop.wait(min(self.interval, self.threshold) / 2):
+            with self._lock:
+                beat = self._beat
+                caught = self._current is not None
+            blocked = time.monotonic() - beat - self.interval
+            if caught or blocked < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            summary = traceback.extract_stack(frame, STACK_DEPTH)
+            del frame
+            innermost = summary[-1]
+            where = f"{innermost.filename}:{innermost.lineno} in {innermost.name}"
+            with self._lock:
+                # the loop may have woken up while the stack was copied, then it wasn't blocked there
+                if self._beat == beat and self._current is None:
+                    self._current = Stall(time.time() - blocked, blocked, "".join(summary.format()), where)
+                    self.stalls.append(self._current)
+
+    def stop(self) -> None:
+        self._task.cancel()
+        self._stop.set()
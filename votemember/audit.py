@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+log = logging.getLogger("red.GleeCog.votemember")
+
+# event -> how it reads in votemember history, `{voter}` and `{member}` are mentions
+EVENTS = {
+    "opened": "vote on {member} opened",
+    "for": "{voter} voted for {member}",
+    "against": "{voter} voted against {member}",
+    "retract_for": "{voter} took back their vote for {member}",
+    "retract_against": "{voter} took back their vote against {member}",
+    "voted_in": "{member} was voted in",
+    "voted_out": "{member} was voted out",
+    "expired": "vote on {member} expired",
+    "left": "{member} left during the vote",
+}
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS vote_events (
+        id INTEGER PRIMARY KEY,
+        at REAL NOT NULL,
+        guild_id INTEGER NOT NULL,
+        member_id INTEGER NOT NULL,
+        voter_id INTEGER,
+        message_id INTEGER NOT NULL,
+        event TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS vote_events_member ON vote_events (guild_id, member_id, id)",
+    "CREATE INDEX IF NOT EXISTS vote_events_guild ON vote_events (guild_id, id)",
+)
+
+
+class AuditEvent(NamedTuple):
+    at: float
+    guild_id: int
+    member_id: int
+    voter_id: Optional[int]
+    message_id: int
+    event: str
+
+
+class AuditLog:
+    """
+    Append-only log of what happened to every vote, in a SQLite file of its own.
+
+    `record` only appends to a buffer, so the event handlers never wait on disk.
+    The buffer is written in one transaction every `flush_interval` seconds or
+    as soon as it holds `max_buffer` events.
+    """
+
+    def __init__(self, bot, path: Path, flush_interval: float = 5.0, max_buffer: int = 500):
+        self.bot = bot
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[AuditEvent] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="votemember-audit")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._full = asyncio.Event()
+        self._task = bot.loop.create_task(self._flush_loop())
+
+    def record(
+        self, event: str, guild_id: int, member_id: int, message_id: int, voter_id: Optional[int] = None
+    ) -> None:
+        self._buffer.append(AuditEvent(time.time(), guild_id, member_id, voter_id, message_id, event))
+        if len(self._buffer) >= self.max_buffer:
+            self._full.set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+        return self._conn
+
+    def _write(self, events: List[AuditEvent]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO vote_events (at, guild_id, member_id, voter_id, message_id, event) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                events,
+            )
+
+    def _query(self, guild_id: int, member_id: Optional[int], limit: int) -> List[AuditEvent]:
+        # both cases walk an index backwards from the newest event
+        if member_id is None:
+            where, args = "guild_id = ?", (guild_id, limit)
+        else:
+            where, args = "guild_id = ? AND member_id = ?", (guild_id, member_id, limit)
+        rows = self._connect().execute(
+            "SELECT at, guild_id, member_id, voter_id, message_id, event FROM vote_events "
+            f"WHERE {where} ORDER BY id DESC LIMIT ?",
+            args,
+        )
+        return [AuditEvent(*row) for row in rows]
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        events, self._buffer = self._buffer, []
+        self._full.clear()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, events)
+        except Exception:
+            log.error("Error writing %s vote events to the audit log", len(events), exc_info=True)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def history(self, guild_id: int, member_id: Optional[int] = None, limit: int = 100) -> List[AuditEvent]:
+        """
+        The newest events of a guild, or of the votes on one member, newest first.
+        """
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._query, guild_id, member_id, limit)
+
+    def close(self) -> None:
+        self._task.cancel()
+        # the executor finishes queued work after shutdown, so the last events still get written
+        if self._buffer:
+            self._executor.submit(self._write, self._buffer)
+            self._buffer = []
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
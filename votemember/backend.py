@@ -0,0 +1,258 @@
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from .storage import VoteDatabase
+from .votes import PendingVote, VoteKey, VoteStore
+
+
+class VoteBackend:
+    """
+    Where open votes and their tallies live.
+
+    Every method that changes a vote is atomic on its own, so callers never
+    read a vote, change it and write it back. `claim` is how a vote gets
+    finished: it succeeds for exactly one caller, which must then either
+    `remove` the vote or `release` it to reopen it.
+
+    Votes handed out are snapshots unless the backend says otherwise, they
+    don't follow later changes.
+    """
+
+    #: whether other processes see the same votes, so a vote in a guild this
+    #: process doesn't know about belongs to someone else rather than being stale
+    shared = False
+
+    async def open(self) -> List[PendingVote]:
+        """
+        Prepare the backend and return the votes that are still open, oldest first.
+        """
+        raise NotImplementedError
+
+    async def all(self) -> List[PendingVote]:
+        raise NotImplementedError
+
+    async def get(self, key: VoteKey) -> Optional[PendingVote]:
+        raise NotImplementedError
+
+    async def for_member(self, guild_id: int, member_id: int) -> Optional[PendingVote]:
+        raise NotImplementedError
+
+    async def in_guild(self, guild_id: int) -> List[PendingVote]:
+        """
+        Open votes of one guild, oldest first.
+        """
+        raise NotImplementedError
+
+    async def add(self, votes: List[PendingVote]) -> List[PendingVote]:
+        """
+        Start tracking votes, returns the votes evicted to stay under the cap.
+        """
+        raise NotImplementedError
+
+    async def remove(self, keys: Iterable[VoteKey]) -> None:
+        raise NotImplementedError
+
+    async def cast(
+        self, key: VoteKey, user_id: int, positive: bool, add: bool, weight: float = 1.0
+    ) -> Optional[PendingVote]:
+        """
+        Add or take back one user's vote, counting `weight` towards the score of its side.
+        Returns the updated vote or None if it isn't open or is being finished.
+        """
+        raise NotImplementedError
+
+    async def set_voters(
+        self, key: VoteKey, positive: Set[int], negative: Set[int], weights: Dict[int, float]
+    ) -> Optional[PendingVote]:
+        """
+        Replace both sides of a vote, used when catching up on missed reactions.
+        `weights` has the weight of voters that don't count 1.
+        """
+        raise NotImplementedError
+
+    async def claim(self, key: VoteKey) -> Optional[PendingVote]:
+        """
+        Mark a vote as finishing, returns its tally or None if someone else got it first.
+        """
+        raise NotImplementedError
+
+    async def release(self, key: VoteKey) -> None:
+        raise NotImplementedError
+
+    async def expire(self, now: float) -> List[PendingVote]:
+        """
+        Remove and return every vote whose expiry time is at or before `now`.
+        """
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(VoteBackend):
+    """
+    Votes kept in this process, optionally copied to a database so they survive restarts.
+
+    Nothing here awaits between reading and changing a vote, which is what makes the
+    updates atomic. The votes handed out are the live objects.
+    """
+
+    def __init__(self, max_size: int, database: Optional[VoteDatabase] = None):
+        self._store = VoteStore(max_size)
+        self._db = database
+
+    async def open(self) -> List[PendingVote]:
+        if self._db is None:
+            return []
+        votes = await self._db.load_all()
+        now = time.time()
+        dropped = [vote for vote in votes if vote.expires_at is not None and vote.expires_at <= now]
+        votes = [vote for vote in votes if vote.expires_at is None or vote.expires_at > now]
+        # snowflakes grow with time, so adding by message id keeps the store oldest first
+        votes.sort(key=lambda vote: vote.message_id)
+        for vote in votes:
+            # a vote can't still be finishing after a restart
+            vote.finishing = False
+            dropped.extend(self._store.add(vote))
+        await self._db.delete(vote.key for vote in dropped)
+        return list(self._store)
+
+    async def all(self) -> List[PendingVote]:
+        return list(self._store)
+
+    async def get(self, key: VoteKey) -> Optional[PendingVote]:
+        return self._store.get(*key)
+
+    async def for_member(self, guild_id: int, member_id: int) -> Optional[PendingVote]:
+        return self._store.for_member(guild_id, member_id)
+
+    async def in_guild(self, guild_id: int) -> List[PendingVote]:
+        return self._store.in_guild(guild_id)
+
+    async def add(self, votes: List[PendingVote]) -> List[PendingVote]:
+        evicted = []
+        for vote in votes:
+            evicted.extend(self._store.add(vote))
+        if self._db is not None:
+            await self._db.delete(vote.key for vote in evicted)
+            await self._db.save(*votes)
+        return evicted
+
+    async def remove(self, keys: Iterable[VoteKey]) -> None:
+        keys = list(keys)
+        for key in keys:
+            self._store.pop(key)
+        if self._db is not None:
+            await self._db.delete(keys)
+
+    async def cast(
+        self, key: VoteKey, user_id: int, positive: bool, add: bool, weight: float = 1.0
+    ) -> Optional[PendingVote]:
+        vote = self._store.get(*key)
+        if vote is None or vote.finishing:
+            return None
+        if vote.cast(user_id, positive, add, weight) and self._db is not None:
+            await self._db.save(vote)
+        return vote
+
+    async def set_voters(
+        self, key: VoteKey, positive: Set[int], negative: Set[int], weights: Dict[int, float]
+    ) -> Optional[PendingVote]:
+        vote = self._store.get(*key)
+        if vote is None or vote.finishing:
+            return vote
+        vote.reset(set(positive), set(negative), weights)
+        if self._db is not None:
+            await self._db.save(vote)
+        return vote
+
+    async def claim(self, key: VoteKey) -> Optional[PendingVote]:
+        vote = self._store.get(*key)
+        if vote is None or vote.finishing:
+            return None
+        vote.finishing = True
+        return vote
+
+    async def release(self, key: VoteKey) -> None:
+        vote = self._store.get(*key)
+        if vote is not None:
+            vote.finishing = False
+
+    async def expire(self, now: float) -> List[PendingVote]:
+        expired = self._store.expire(now)
+        if self._db is not None:
+            await self._db.delete(vote.key for vote in expired)
+        return expired
+
+    async def count(self) -> int:
+        return len(self._store)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+
+
+class SQLiteBackend(VoteBackend):
+    """
+    Votes kept only in a SQLite database in WAL mode, which several processes
+    on one machine can share. Every update is a single transaction.
+    """
+
+    shared = True
+
+    def __init__(self, database: VoteDatabase, max_size: int):
+        self._db = database
+        self.max_size = max_size
+
+    async def open(self) -> List[PendingVote]:
+        await self._db.expire(time.time())
+        return await self._db.load_all()
+
+    async def all(self) -> List[PendingVote]:
+        return await self._db.load_all()
+
+    async def get(self, key: VoteKey) -> Optional[PendingVote]:
+        return await self._db.get(key)
+
+    async def for_member(self, guild_id: int, member_id: int) -> Optional[PendingVote]:
+        return await self._db.for_member(guild_id, member_id)
+
+    async def in_guild(self, guild_id: int) -> List[PendingVote]:
+        return await self._db.in_guild(guild_id)
+
+    async def add(self, votes: List[PendingVote]) -> List[PendingVote]:
+        return await self._db.add(votes, self.max_size)
+
+    async def remove(self, keys: Iterable[VoteKey]) -> None:
+        await self._db.delete(keys)
+
+    async def cast(
+        self, key: VoteKey, user_id: int, positive: bool, add: bool, weight: float = 1.0
+    ) -> Optional[PendingVote]:
+        return await self._db.cast(key, user_id, positive, add, weight)
+
+    async def set_voters(
+        self, key: VoteKey, positive: Set[int], negative: Set[int], weights: Dict[int, float]
+    ) -> Optional[PendingVote]:
+        return await self._db.set_voters(key, positive, negative, weights)
+
+    async def claim(self, key: VoteKey) -> Optional[PendingVote]:
+        return await self._db.claim(key)
+
+    async def release(self, key: VoteKey) -> None:
+        await self._db.release(key)
+
+    async def expire(self, now: float) -> List[PendingVote]:
+        return await self._db.expire(now)
+
+    async def count(self) -> int:
+        return await self._db.count()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+BACKENDS = ("memory", "sqlite")
@@ -0,0 +1,203 @@
+import contextvars
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+# upper bounds of the histogram buckets in milliseconds, the last bucket takes everything above
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# time spent waiting on each kind of I/O, by the handler that is running
+KINDS = ("config", "discord")
+
+# [config seconds, discord seconds] of the innermost timed handler
+_current: contextvars.ContextVar = contextvars.ContextVar("votemember_timing", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the `q` quantile falls in, the largest time seen for the last bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "max_ms": self.max,
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS_MS + ("inf",), self.counts)},
+        }
+
+
+class _HandlerTimer:
+    __slots__ = ("metrics", "name", "start", "spent", "token")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.spent = [0.0, 0.0]
+        self.token = _current.set(self.spent)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self.token)
+        parent = _current.get()
+        observe = self.metrics.observe
+        observe(self.name, elapsed * 1000)
+        for index, kind in enumerate(KINDS):
+            observe(f"{self.name}.{kind}", self.spent[index] * 1000)
+            # a handler called from another one also counts towards the outer one
+            if parent is not None:
+                parent[index] += self.spent[index]
+
+
+class _IOTimer:
+    __slots__ = ("metrics", "index", "kind", "start")
+
+    def __init__(self, metrics: "Metrics", kind: str):
+        self.metrics = metrics
+        self.kind = kind
+        self.index = KINDS.index(kind)
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.kind, elapsed * 1000)
+        spent = _current.get()
+        if spent is not None:
+            spent[self.index] += elapsed
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Latency histograms and counters of the votemember hot paths.
+
+    Counters are always kept, they cost a dict update. Timing only happens while
+    `enabled` is set, otherwise `handler` and `io` hand out a shared no-op timer.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.since = time.time()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, ms: float) -> None:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(ms)
+
+    def handler(self, name: str):
+        """
+        Time a whole handler, with the config and discord time inside it split out.
+        """
+        return _HandlerTimer(self, name) if self.enabled else NULL_TIMER
+
+    def io(self, kind: str):
+        """
+        Time a Config read or write (`config`) or a Discord API call (`discord`).
+        """
+        return _IOTimer(self, kind) if self.enabled else NULL_TIMER
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.since = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Everything collected so far as plain data, for scraping.
+        """
+        return {
+            "enabled": self.enabled,
+            "since": self.since,
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+        }
+
+    def summary(self, names: Optional[List[str]] = None) -> List[List[Any]]:
+        """
+        Rows of name, count, mean, p50, p95, p99 and max in milliseconds.
+        """
+        rows = []
+        for name in names if names is not None else sorted(self.histograms):
+            histogram = self.histograms.get(name)
+            if histogram is None or not histogram.count:
+                continue
+            rows.append(
+                [
+                    name,
+                    histogram.count,
+                    histogram.total / histogram.count,
+                    histogram.quantile(0.5),
+                    histogram.quantile(0.95),
+                    histogram.quantile(0.99),
+                    histogram.max,
+                ]
+            )
+        return rows
+
+
+def timed(name: str):
+    """
+    Time a coroutine method of a cog with a `metrics` attribute under `name`.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return await func(self, *args, **kwargs)
+            with metrics.handler(name):
+                return await func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,59 @@
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+import discord
+
+
+class Template:
+    """
+    A message template parsed once, rendered by joining its parts.
+
+    Only plain `{name}` fields are allowed, so a template that would fail
+    to format is rejected when it's compiled rather than when it's sent.
+    """
+
+    __slots__ = ("text", "_parts")
+
+    def __init__(self, text: str, fields: Iterable[str]):
+        allowed = set(fields)
+        parts: List[Tuple[str, str]] = []
+        try:
+            parsed = list(Formatter().parse(text))
+        except ValueError as e:
+            raise ValueError(f"The message isn't a valid template: {e}") from None
+        for literal, field, spec, conversion in parsed:
+            if field is not None and field not in allowed:
+                raise ValueError(
+                    "Unknown field {%s}, you can use: %s"
+                    % (field, ", ".join("{%s}" % name for name in sorted(allowed)))
+                )
+            if spec or conversion:
+                raise ValueError("Fields can't have conversions or format specs, use just {%s}" % field)
+            parts.append((literal, field))
+        self.text = text
+        self._parts = tuple(parts)
+
+    def render(self, **values: str) -> str:
+        return "".join(literal + (values[field] if field is not None else "") for literal, field in self._parts)
+
+
+class RoleIndex:
+    """
+    The roles votemember hands out in one guild, with their mentions joined once.
+    """
+
+    __slots__ = ("ids", "mentions")
+
+    def __init__(self, guild: discord.Guild, role_ids: Iterable[int]):
+        roles = [role for role in map(guild.get_role, role_ids) if role is not None]
+        roles.sort(key=lambda role: role.position)
+        self.ids: FrozenSet[int] = frozenset(role.id for role in roles)
+        self.mentions = ", ".join(role.mention for role in roles)
+
+
+# settings key -> fields its template may use
+TEMPLATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "AGREE_MSG": ("mention", "roles"),
+    "VOTE_SUCCEEDED": ("mention", "roles", "people"),
+    "VOTE_CANCELLED": ("mention", "roles", "people"),
+}
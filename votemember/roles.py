@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+import discord
+
+log = logging.getLogger("red.GleeCog.votemember")
+
+
+class RoleRequest:
+    __slots__ = ("role_ids", "reason", "future")
+
+    def __init__(self, role_ids: Set[int], reason: Optional[str], future: asyncio.Future):
+        self.role_ids = role_ids
+        self.reason = reason
+        self.future = future
+
+
+class RoleQueue:
+    """
+    Per-guild queue of pending role grants worked off by a fixed pool of workers.
+
+    Requests for a member that is already waiting are merged into one `add_roles` call.
+    A guild is only ever handled by one worker at a time, so a guild that is being
+    rate limited backs off without holding up the others.
+    """
+
+    def __init__(self, bot, workers: int, max_retries: int = 5, backoff: float = 1.0):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # guild id -> member id -> request, in the order members were queued
+        self._pending: Dict[int, Dict[int, RoleRequest]] = {}
+        # guilds that are waiting in `_ready` or being handled by a worker
+        self._scheduled: Set[int] = set()
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._workers = [bot.loop.create_task(self._worker()) for _ in range(workers)]
+
+    def enqueue(
+        self, member: discord.Member, role_ids: Iterable[int], reason: Optional[str] = None
+    ) -> asyncio.Future:
+        """
+        Queue roles for a member, the returned future resolves to whether they were granted.
+        """
+        guild_id = member.guild.id
+        pending = self._pending.setdefault(guild_id, {})
+        request = pending.get(member.id)
+        if request is None:
+            request = pending[member.id] = RoleRequest(
+                set(role_ids), reason, self.bot.loop.create_future()
+            )
+        else:
+            request.role_ids.update(role_ids)
+            request.reason = reason or request.reason
+        if guild_id not in self._scheduled:
+            self._scheduled.add(guild_id)
+            self._ready.put_nowait(guild_id)
+        return request.future
+
+    def depth(self, guild_id: Optional[int] = None) -> int:
+        """
+        Number of members waiting for roles, in one guild or in all of them.
+        """
+        if guild_id is not None:
+            return len(self._pending.get(guild_id, ()))
+        return sum(map(len, self._pending.values()))
+
+    def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        for pending in self._pending.values():
+            for request in pending.values():
+                request.future.cancel()
+        self._pending.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            guild_id = await self._ready.get()
+            pending = self._pending.get(guild_id)
+            if pending:
+                member_id = next(iter(pending))
+                request = pending.pop(member_id)
+                try:
+                    granted = await self._apply(guild_id, member_id, request)
+                except Exception:
+                    log.error("Error giving roles to member %s", member_id, exc_info=True)
+                    granted = False
+                if not request.future.done():
+                    request.future.set_result(granted)
+            # requeue at the back so one busy guild can't starve the others
+            if self._pending.get(guild_id):
+                self._ready.put_nowait(guild_id)
+            else:
+                self._pending.pop(guild_id, None)
+                self._scheduled.discard(guild_id)
+
+    async def _apply(self, guild_id: int, member_id: int, request: RoleRequest) -> bool:
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(member_id) if guild is not None else None
+        if member is None:
+            return False
+        roles = [
+            role
+            for role in map(guild.get_role, request.role_ids)
+            if role is not None and role not in member.roles
+        ]
+        if not roles:
+            return True
+        for attempt in range(self.max_retries):
+            try:
+                await member.add_roles(*roles, reason=request.reason)
+                return True
+            except discord.HTTPException as e:
+                retryable = e.status == 429 or e.status >= 500
+                if not retryable or attempt + 1 == self.max_retries:
+                    log.error("Couldn't give roles to member %s: %s", member_id, e)
+                    return False
+                delay = self.backoff * 2 ** attempt
+                log.debug("Giving roles to member %s failed (%s), retrying in %ss", member_id, e.status, delay)
+                await asyncio.sleep(delay)
+        return False
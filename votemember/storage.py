@@ -0,0 +1,275 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .votes import PendingVote, VoteKey
+
+VoteRow = Tuple[int, int, int, int, int, Optional[float], str, str, int, str]
+
+COLUMNS = "message_id, slot, channel_id, guild_id, member_id, expires_at, positive, negative, finishing, weights"
+PLACEHOLDERS = ", ".join("?" * len(COLUMNS.split(", ")))
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS pending_votes (
+        message_id INTEGER NOT NULL,
+        slot INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        member_id INTEGER NOT NULL,
+        expires_at REAL,
+        positive TEXT NOT NULL,
+        negative TEXT NOT NULL,
+        finishing INTEGER NOT NULL DEFAULT 0,
+        weights TEXT NOT NULL DEFAULT '{}',
+        PRIMARY KEY (message_id, slot)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS pending_votes_member ON pending_votes (guild_id, member_id)",
+    "CREATE INDEX IF NOT EXISTS pending_votes_expiry ON pending_votes (expires_at)",
+)
+
+def vote_to_row(vote: PendingVote) -> VoteRow:
+    return (
+        vote.message_id,
+        vote.slot,
+        vote.channel_id,
+        vote.guild_id,
+        vote.member_id,
+        vote.expires_at,
+        json.dumps(sorted(vote.positive)),
+        json.dumps(sorted(vote.negative)),
+        int(vote.finishing),
+        json.dumps(vote.weights or {}),
+    )
+
+
+def row_to_vote(row: VoteRow) -> PendingVote:
+    message_id, slot, channel_id, guild_id, member_id, expires_at, positive, negative, finishing, weights = row
+    vote = PendingVote(
+        message_id,
+        channel_id,
+        guild_id,
+        member_id,
+        expires_at=expires_at,
+        positive=set(json.loads(positive)),
+        negative=set(json.loads(negative)),
+        slot=slot,
+        weights={int(user_id): weight for user_id, weight in json.loads(weights).items()},
+    )
+    vote.finishing = bool(finishing)
+    return vote
+
+
+class VoteDatabase:
+    """
+    SQLite (WAL mode) table of pending votes.
+
+    It is either a copy of the in-memory votes so they survive restarts, or the
+    shared state of several processes, which is why the tally updates run in
+    `BEGIN IMMEDIATE` transactions. All queries run on a single worker thread so
+    the event loop never waits on disk.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="votemember-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # autocommit, transactions are opened explicitly so they can take the write lock up front
+            self._conn = sqlite3.connect(
+                str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._transaction() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+        return self._conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _select(self, where: str, *args) -> List[VoteRow]:
+        return self._connect().execute(f"SELECT {COLUMNS} FROM pending_votes {where}", args).fetchall()
+
+    def _get(self, key: VoteKey) -> Optional[VoteRow]:
+        rows = self._select("WHERE message_id = ? AND slot = ?", *key)
+        return rows[0] if rows else None
+
+    def _save(self, rows: List[VoteRow]) -> None:
+        self._connect()
+        with self._transaction() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO pending_votes ({COLUMNS}) VALUES ({PLACEHOLDERS})", rows)
+
+    def _add(self, rows: List[VoteRow], max_size: int) -> List[VoteRow]:
+        self._connect()
+        with self._transaction() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO pending_votes ({COLUMNS}) VALUES ({PLACEHOLDERS})", rows)
+            (count,) = conn.execute("SELECT COUNT(*) FROM pending_votes").fetchone()
+            evicted = []
+            if count > max_size:
+                evicted = conn.execute(
+                    f"SELECT {COLUMNS} FROM pending_votes ORDER BY message_id, slot LIMIT ?", (count - max_size,)
+                ).fetchall()
+                conn.executemany(
+                    "DELETE FROM pending_votes WHERE message_id = ? AND slot = ?", [row[:2] for row in evicted]
+                )
+        return evicted
+
+    def _delete(self, keys: List[VoteKey]) -> None:
+        self._connect()
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM pending_votes WHERE message_id = ? AND slot = ?", keys)
+
+    def _cast(self, key: VoteKey, user_id: int, positive: bool, add: bool, weight: float) -> Optional[VoteRow]:
+        self._connect()
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT {COLUMNS} FROM pending_votes WHERE message_id = ? AND slot = ?", key
+            ).fetchone()
+            if row is None or row[8]:
+                return None
+            vote = row_to_vote(row)
+            if not vote.cast(user_id, positive, add, weight):
+                return row
+            row = vote_to_row(vote)
+            conn.execute(
+                "UPDATE pending_votes SET positive = ?, negative = ?, weights = ? WHERE message_id = ? AND slot = ?",
+                (row[6], row[7], row[9], *key),
+            )
+        return row
+
+    def _set_voters(self, key: VoteKey, positive: str, negative: str, weights: str) -> Optional[VoteRow]:
+        self._connect()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE pending_votes SET positive = ?, negative = ?, weights = ? "
+                "WHERE message_id = ? AND slot = ? AND finishing = 0",
+                (positive, negative, weights, *key),
+            )
+            return conn.execute(
+                f"SELECT {COLUMNS} FROM pending_votes WHERE message_id = ? AND slot = ?", key
+            ).fetchone()
+
+    def _claim(self, key: VoteKey) -> Optional[VoteRow]:
+        self._connect()
+        with self._transaction() as conn:
+            # only one caller, in any process, sees the row change
+            claimed = conn.execute(
+                "UPDATE pending_votes SET finishing = 1 WHERE message_id = ? AND slot = ? AND finishing = 0", key
+            ).rowcount
+            if not claimed:
+                return None
+            return conn.execute(
+                f"SELECT {COLUMNS} FROM pending_votes WHERE message_id = ? AND slot = ?", key
+            ).fetchone()
+
+    def _release(self, key: VoteKey) -> None:
+        self._connect().execute("UPDATE pending_votes SET finishing = 0 WHERE message_id = ? AND slot = ?", key)
+
+    def _expire(self, now: float) -> List[VoteRow]:
+        self._connect()
+        with self._transaction() as conn:
+            # a vote still finishing by then was claimed by a process that died
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM pending_votes WHERE expires_at <= ?", (now,)
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM pending_votes WHERE message_id = ? AND slot = ?", [row[:2] for row in rows]
+            )
+        return rows
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def load_all(self) -> List[PendingVote]:
+        return [row_to_vote(row) for row in await self._run(self._select, "ORDER BY message_id, slot")]
+
+    async def get(self, key: VoteKey) -> Optional[PendingVote]:
+        row = await self._run(self._get, key)
+        return row_to_vote(row) if row is not None else None
+
+    async def for_member(self, guild_id: int, member_id: int) -> Optional[PendingVote]:
+        rows = await self._run(
+            self._select, "WHERE guild_id = ? AND member_id = ? ORDER BY message_id DESC LIMIT 1", guild_id, member_id
+        )
+        return row_to_vote(rows[0]) if rows else None
+
+    async def in_guild(self, guild_id: int) -> List[PendingVote]:
+        rows = await self._run(self._select, "WHERE guild_id = ? ORDER BY message_id, slot", guild_id)
+        return [row_to_vote(row) for row in rows]
+
+    async def count(self) -> int:
+        rows = await self._run(lambda: self._connect().execute("SELECT COUNT(*) FROM pending_votes").fetchall())
+        return rows[0][0]
+
+    async def save(self, *votes: PendingVote) -> None:
+        if votes:
+            await self._run(self._save, [vote_to_row(vote) for vote in votes])
+
+    async def add(self, votes: List[PendingVote], max_size: int) -> List[PendingVote]:
+        rows = await self._run(self._add, [vote_to_row(vote) for vote in votes], max_size)
+        return [row_to_vote(row) for row in rows]
+
+    async def delete(self, keys: Iterable[VoteKey]) -> None:
+        keys = list(keys)
+        if keys:
+            await self._run(self._delete, keys)
+
+    async def cast(
+        self, key: VoteKey, user_id: int, positive: bool, add: bool, weight: float = 1.0
+    ) -> Optional[PendingVote]:
+        row = await self._run(self._cast, key, user_id, positive, add, weight)
+        return row_to_vote(row) if row is not None else None
+
+    async def set_voters(
+        self, key: VoteKey, positive: Set[int], negative: Set[int], weights: Dict[int, float]
+    ) -> Optional[PendingVote]:
+        weights = {
+            user_id: weight
+            for user_id, weight in weights.items()
+            if weight != 1.0 and (user_id in positive or user_id in negative)
+        }
+        row = await self._run(
+            self._set_voters,
+            key,
+            json.dumps(sorted(positive)),
+            json.dumps(sorted(negative)),
+            json.dumps(weights),
+        )
+        return row_to_vote(row) if row is not None else None
+
+    async def claim(self, key: VoteKey) -> Optional[PendingVote]:
+        row = await self._run(self._claim, key)
+        return row_to_vote(row) if row is not None else None
+
+    async def release(self, key: VoteKey) -> None:
+        await self._run(self._release, key)
+
+    async def expire(self, now: float) -> List[PendingVote]:
+        return [row_to_vote(row) for row in await self._run(self._expire, now)]
+
+    def close(self) -> None:
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+import discord
+
+# float weights add up with rounding error, a score this close to the quorum reaches it
+EPSILON = 1e-9
+
+
+class WeightTable:
+    """
+    How much one vote of each role counts in a guild, built once from the settings.
+
+    A member counts as much as their highest weighted role, members without
+    a weighted role count 1. With no weights set every vote counts 1, which is
+    plain vote counting.
+    """
+
+    __slots__ = ("weights",)
+
+    def __init__(self, guild: discord.Guild, weights: Dict[str, float]):
+        # Config keeps the role ids as strings, roles that were deleted are left out
+        self.weights: Dict[int, float] = {
+            int(role_id): weight for role_id, weight in weights.items() if guild.get_role(int(role_id)) is not None
+        }
+
+    def weight(self, member: Optional[discord.Member]) -> float:
+        if not self.weights or member is None:
+            return 1.0
+        weights = [self.weights[role.id] for role in member.roles if role.id in self.weights]
+        return max(weights) if weights else 1.0
+
+
+def decide(positive_score: float, negative_score: float, positive_needed: float, negative_needed: float) -> Optional[bool]:
+    """
+    True once the member is voted in, False once they are voted out, None while undecided.
+    A negative quorum of 0 means members can't be voted out.
+    """
+    if positive_score >= positive_needed - EPSILON:
+        return True
+    if 0 < negative_needed and negative_score >= negative_needed - EPSILON:
+        return False
+    return None
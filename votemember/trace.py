@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from .votes import PendingVote
+
+log = logging.getLogger("red.GleeCog.votemember")
+
+TRACE_VERSION = 1
+
+# settings a replay needs to make the same decisions, the reactions are stored as emoji tokens
+TRACED_SETTINGS = (
+    "ENABLED",
+    "POSITIVE_NEEDED",
+    "NEGATIVE_NEEDED",
+    "DIGEST_THRESHOLD",
+    "DIGEST_WINDOW",
+    "VOTE_TTL",
+)
+
+
+class TraceRecorder:
+    """
+    Writes the events reaching the votemember handlers to a gzipped JSON lines file.
+
+    Ids are replaced by small numbers handed out in order of appearance, one
+    sequence each for guilds, channels, messages and users, and custom emojis
+    become `custom:<number>`. The mapping only lives in memory, so a trace
+    can't be tied back to the servers it came from.
+
+    Each line has `t`, milliseconds since recording started, and `e`, the kind:
+    `h` header, `s` guild settings, `j` join, `l` leave, `+`/`-` reaction added
+    or removed and `o` vote outcome. Reactions that counted towards a vote carry
+    the member voted on (`v`), the side (`p`) and the voter's weight (`w`),
+    so a replay can aim them at its own agreement messages.
+    """
+
+    def __init__(self, bot, path: Path, flush_interval: float = 5.0):
+        self.bot = bot
+        self.path = path
+        self.flush_interval = flush_interval
+        self.events = 0
+        self._start = time.monotonic()
+        self._ids: Dict[str, Dict[int, int]] = {"g": {}, "c": {}, "m": {}, "u": {}}
+        self._emojis: Dict[str, str] = {}
+        self._buffer: List[str] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="votemember-trace")
+        self._file = None
+        self._record({"e": "h", "version": TRACE_VERSION, "started": int(time.time())})
+        self._task = bot.loop.create_task(self._flush_loop())
+
+    def _anon(self, kind: str, snowflake: int) -> int:
+        ids = self._ids[kind]
+        anon = ids.get(snowflake)
+        if anon is None:
+            anon = ids[snowflake] = len(ids) + 1
+        return anon
+
+    def _emoji(self, key: str) -> str:
+        # custom emoji keys are their ids, unicode emojis are kept as they are
+        if not key.isdigit():
+            return key
+        token = self._emojis.get(key)
+        if token is None:
+            token = self._emojis[key] = f"custom:{len(self._emojis) + 1}"
+        return token
+
+    def _record(self, record: Dict[str, Any]) -> None:
+        record["t"] = int((time.monotonic() - self._start) * 1000)
+        self._buffer.append(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+        self.events += 1
+
+    def settings(self, guild_id: int, settings: Dict[str, Any], positive_key: str, negative_key: str) -> None:
+        record = {"e": "s", "g": self._anon("g", guild_id)}
+        record.update((key, settings[key]) for key in TRACED_SETTINGS)
+        record["channel"] = settings["AGREE_CHANNEL"] is not None
+        record["positive"] = self._emoji(positive_key)
+        record["negative"] = self._emoji(negative_key)
+        self._record(record)
+
+    def join(self, member: discord.Member) -> None:
+        self._record({"e": "j", "g": self._anon("g", member.guild.id), "u": self._anon("u", member.id)})
+
+    def leave(self, member: discord.Member) -> None:
+        self._record({"e": "l", "g": self._anon("g", member.guild.id), "u": self._anon("u", member.id)})
+
+    def reaction(
+        self,
+        payload: discord.raw_models.RawReactionActionEvent,
+        key: str,
+        added: bool,
+        vote: Optional[PendingVote] = None,
+        positive: bool = False,
+        weight: float = 1.0,
+    ) -> None:
+        record = {
+            "e": "+" if added else "-",
+            "g": self._anon("g", payload.guild_id),
+            "c": self._anon("c", payload.channel_id),
+            "m": self._anon("m", payload.message_id),
+            "u": self._anon("u", payload.user_id),
+            "r": self._emoji(key),
+        }
+        member = getattr(payload, "member", None)
+        if member is not None and member.bot:
+            record["bot"] = 1
+        if vote is not None:
+            record["v"] = self._anon("u", vote.member_id)
+            record["p"] = int(positive)
+            if weight != 1.0:
+                record["w"] = weight
+        self._record(record)
+
+    def outcome(self, vote: PendingVote, add: bool) -> None:
+        self._record(
+            {
+                "e": "o",
+                "g": self._anon("g", vote.guild_id),
+                "m": self._anon("m", vote.message_id),
+                "u": self._anon("u", vote.member_id),
+                "r": "in" if add else "out",
+            }
+        )
+
+    def _write(self, lines: List[str]) -> None:
+        if self._file is None:
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._file.write("\n".join(lines) + "\n")
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, lines)
+        except Exception:
+            log.error("Error writing %s events to the trace %s", len(lines), self.path, exc_info=True)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def close(self) -> None:
+        self._task.cancel()
+        if self._buffer:
+            self._executor.submit(self._write, self._buffer)
+            self._buffer = []
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
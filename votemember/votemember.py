@@ -1,12 +1,29 @@
+import asyncio
 import logging
 import random
+import re
 import string
-from typing import Optional, cast
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, cast
 
 import discord
 from redbot import VersionInfo, version_info
 from redbot.core import Config, checks, commands
+from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
+from redbot.core.utils.chat_formatting import box, pagify
+from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
+
+from .audit import EVENTS, AuditLog
+from .backend import BACKENDS, MemoryBackend, SQLiteBackend, VoteBackend
+from .metrics import Metrics, timed
+from .render import TEMPLATE_FIELDS, RoleIndex, Template
+from .roles import RoleQueue
+from .storage import VoteDatabase
+from .tally import WeightTable, decide
+from .trace import TraceRecorder
+from .votes import PendingVote
 
 default_settings = {
     "ENABLED": False,
@@ -18,7 +35,57 @@ default_settings = {
     "NEGATIVE_REACT": "❌",
     "NEGATIVE_NEEDED": 1,
     "VOTE_SUCCEEDED": "Voting successful, user {mention} was awarded role {roles} by users {people}",
-    "VOTE_CANCELLED": "Voting of {mention} cancelled by users {people}"
+    "VOTE_CANCELLED": "Voting of {mention} cancelled by users {people}",
+    "VOTE_TTL": 7 * 24 * 60 * 60,
+    "DIGEST_THRESHOLD": 0,
+    "DIGEST_WINDOW": 10,
+    # role id -> how much a vote from that role counts, everyone counts 1 when empty
+    "VOTE_WEIGHTS": {},
+}
+
+# hard cap on open votes across all guilds, the oldest vote is dropped beyond it
+MAX_PENDING_VOTES = 10000
+# how often expired votes are swept, in seconds
+EXPIRY_INTERVAL = 60
+# how many agreement messages are fetched at once when catching up on startup
+RECONCILE_CONCURRENCY = 8
+# number of role grants that can be in flight at once, across all guilds
+ROLE_WORKERS = 4
+
+# open votes listed per page of votemember pending
+PENDING_PAGE_SIZE = 10
+# how often buffered vote events are written to the audit log, in seconds,
+# and how many events make it write early
+AUDIT_FLUSH_INTERVAL = 5
+AUDIT_BUFFER_SIZE = 500
+# most events shown by votemember history, and per page
+HISTORY_LIMIT = 200
+HISTORY_PAGE_SIZE = 15
+
+# digest messages list up to 10 members, voted on with the member's number or letter.
+# 20 distinct reactions is also the most a Discord message can hold.
+DIGEST_NUMBERS = ("1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟")
+DIGEST_LETTERS = ("🇦", "🇧", "🇨", "🇩", "🇪", "🇫", "🇬", "🇭", "🇮", "🇯")
+DIGEST_SIZE = len(DIGEST_NUMBERS)
+CUSTOM_EMOJI_RE = re.compile(r"<a?:\w+:(\d+)>")
+
+
+def emoji_key(emoji: Any) -> str:
+    """
+    Comparable form of an emoji: the id of a custom emoji, or the unicode text
+    without variation selectors, which clients don't send consistently.
+    """
+    text = str(emoji)
+    match = CUSTOM_EMOJI_RE.fullmatch(text)
+    if match is not None:
+        return match.group(1)
+    return text.replace("\ufe0f", "")
+
+
+# emoji key -> (slot, whether it is a vote for the member)
+DIGEST_REACTS = {
+    **{emoji_key(emoji): (slot, True) for slot, emoji in enumerate(DIGEST_NUMBERS, 1)},
+    **{emoji_key(emoji): (slot, False) for slot, emoji in enumerate(DIGEST_LETTERS, 1)},
 }
 
 
@@ -42,8 +109,315 @@ class VoteMember(commands.Cog):
         self.bot = bot
         self.config = Config.get_conf(self, 1234123412)
         self.config.register_guild(**default_settings)
+        self.config.register_global(VOTE_BACKEND="memory", METRICS=False)
         self.users = {}
-        self.messages = {}
+        # set up in _initialize, once the backend chosen in Config is known
+        self.votes: Optional[VoteBackend] = None
+        self._ready = asyncio.Event()
+        # switched on from Config in _initialize, counters are kept either way
+        self.metrics = Metrics()
+        # set while votemember trace is recording
+        self.trace: Optional[TraceRecorder] = None
+        # guild id -> snapshot of every default_settings key, kept in sync by the setup commands
+        self._settings: Dict[int, Dict[str, Any]] = {}
+        # guild id -> emoji key -> whether it is a vote for the member, derived from the snapshot
+        self._reacts: Dict[int, Dict[str, bool]] = {}
+        # guild id -> settings key -> compiled message template
+        self._templates: Dict[int, Dict[str, Template]] = {}
+        # guild id -> roles to hand out, dropped whenever one of them or the setting changes
+        self._role_indexes: Dict[int, RoleIndex] = {}
+        # guild id -> vote weight of each weighted role, dropped like the role indexes
+        self._weight_tables: Dict[int, WeightTable] = {}
+        # guild id -> monotonic times of the joins inside the digest window
+        self._joins: Dict[int, Deque[float]] = {}
+        # guild id -> members waiting for the next digest message
+        self._digest_members: Dict[int, List[discord.Member]] = {}
+        self._digest_tasks: Dict[int, asyncio.Task] = {}
+        self.role_queue = RoleQueue(bot, ROLE_WORKERS)
+        self.audit = AuditLog(bot, cog_data_path(self) / "audit.db", AUDIT_FLUSH_INTERVAL, AUDIT_BUFFER_SIZE)
+        self._init_task = self.bot.loop.create_task(self._initialize())
+        self._expiry_task = self.bot.loop.create_task(self._expire_votes())
+
+    async def _get_settings(self, guild: discord.Guild) -> Dict[str, Any]:
+        """
+        Return the settings snapshot for a guild, loading all keys in one Config read
+        the first time the guild is seen.
+        """
+        settings = self._settings.get(guild.id)
+        if settings is None:
+            with self.metrics.io("config"):
+                settings = await self.config.guild(guild).all()
+            self._settings[guild.id] = settings
+            self._update_derived(guild.id, settings)
+            self._trace_settings(guild.id)
+        return settings
+
+    def _update_derived(self, guild_id: int, settings: Dict[str, Any]) -> None:
+        """
+        Rebuild the lookups the hot paths use from the settings snapshot.
+        """
+        reacts = {emoji_key(settings["POSITIVE_REACT"]): True}
+        if settings["NEGATIVE_NEEDED"] > 0:
+            reacts[emoji_key(settings["NEGATIVE_REACT"])] = False
+        self._reacts[guild_id] = reacts
+
+        templates = {}
+        for key, fields in TEMPLATE_FIELDS.items():
+            try:
+                templates[key] = Template(settings[key] or default_settings[key], fields)
+            except ValueError:
+                # saved before templates were checked when they are set
+                log.error("Invalid %s template in guild %s, using the default", key, guild_id)
+                templates[key] = Template(default_settings[key], fields)
+        self._templates[guild_id] = templates
+        self._role_indexes.pop(guild_id, None)
+        self._weight_tables.pop(guild_id, None)
+
+    def _trace_settings(self, guild_id: int) -> None:
+        if self.trace is not None:
+            settings = self._settings[guild_id]
+            self.trace.settings(
+                guild_id, settings, emoji_key(settings["POSITIVE_REACT"]), emoji_key(settings["NEGATIVE_REACT"])
+            )
+
+    def _role_index(self, guild: discord.Guild, settings: Dict[str, Any]) -> RoleIndex:
+        index = self._role_indexes.get(guild.id)
+        if index is None:
+            index = self._role_indexes[guild.id] = RoleIndex(guild, settings["ROLE"])
+        return index
+
+    def _weight_table(self, guild: discord.Guild, settings: Dict[str, Any]) -> WeightTable:
+        table = self._weight_tables.get(guild.id)
+        if table is None:
+            table = self._weight_tables[guild.id] = WeightTable(guild, settings["VOTE_WEIGHTS"])
+        return table
+
+    def cog_unload(self) -> None:
+        self._init_task.cancel()
+        self._expiry_task.cancel()
+        for task in self._digest_tasks.values():
+            task.cancel()
+        self.role_queue.stop()
+        self.audit.close()
+        if self.trace is not None:
+            self.trace.close()
+        if self.votes is not None:
+            self.votes.close()
+
+    async def _initialize(self) -> None:
+        """
+        Open the vote backend, then catch up on the reactions cast
+        on the open votes while the cog was offline.
+        """
+        await self.bot.wait_until_red_ready()
+        try:
+            self.metrics.enabled = await self.config.METRICS()
+            database = VoteDatabase(cog_data_path(self) / "votes.db")
+            if await self.config.VOTE_BACKEND() == "sqlite":
+                self.votes = SQLiteBackend(database, MAX_PENDING_VOTES)
+            else:
+                self.votes = MemoryBackend(MAX_PENDING_VOTES, database)
+            votes = await self.votes.open()
+        except Exception:
+            log.error("Error opening the vote backend, open votes won't be kept", exc_info=True)
+            self.votes = MemoryBackend(MAX_PENDING_VOTES)
+            votes = []
+        finally:
+            self._ready.set()
+        try:
+            # the reaction handlers rely on the snapshot of every guild with a tracked vote
+            for guild_id in {vote.guild_id for vote in votes}:
+                guild = self.bot.get_guild(guild_id)
+                if guild is not None:
+                    await self._get_settings(guild)
+
+            by_message: Dict[int, List[PendingVote]] = {}
+            for vote in votes:
+                by_message.setdefault(vote.message_id, []).append(vote)
+            semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+            await asyncio.gather(
+                *(self._reconcile_message(message_votes, semaphore) for message_votes in by_message.values())
+            )
+            log.debug("Restored %s pending votes", len(votes))
+        except Exception:
+            log.error("Error restoring pending votes", exc_info=True)
+
+    async def _backend(self) -> VoteBackend:
+        """
+        The vote backend, waiting for it to be opened if the cog just loaded.
+        """
+        if not self._ready.is_set():
+            await self._ready.wait()
+        return self.votes
+
+    async def _reconcile_message(self, votes: List[PendingVote], semaphore: asyncio.Semaphore) -> None:
+        """
+        Bring the votes on one agreement message up to date with its reactions.
+        """
+        first = votes[0]
+        guild = self.bot.get_guild(first.guild_id)
+        if guild is None and self.votes.shared:
+            # the guild is handled by another process sharing the backend
+            return
+        channel = guild.get_channel(first.channel_id) if guild is not None else None
+        if channel is None:
+            await self.votes.remove(vote.key for vote in votes)
+            self.metrics.incr("votes_dropped", len(votes))
+            return
+        settings = await self._get_settings(guild)
+        counted = {}
+        for vote in votes:
+            positive_react, negative_react = self._vote_reacts(vote, settings)
+            counted[emoji_key(positive_react)] = vote.positive
+            counted[emoji_key(negative_react)] = vote.negative
+        async with semaphore:
+            try:
+                with self.metrics.io("discord"):
+                    message = await channel.fetch_message(first.message_id)
+            except discord.NotFound:
+                await self.votes.remove(vote.key for vote in votes)
+                self.metrics.incr("votes_dropped", len(votes))
+                return
+            except discord.HTTPException:
+                return
+            fetched = {}
+            for reaction in message.reactions:
+                key = emoji_key(reaction.emoji)
+                voters = counted.get(key)
+                if voters is None:
+                    continue
+                # the count includes our own reaction. An unchanged count can still be
+                # different users, so only a reaction nobody voted with is skipped
+                if not voters and reaction.count - reaction.me == 0:
+                    fetched[key] = set()
+                    continue
+                try:
+                    with self.metrics.io("discord"):
+                        users = await reaction.users().flatten()
+                except discord.HTTPException:
+                    return
+                # other bots' reactions aren't votes, like in _match_reaction
+                fetched[key] = {user.id for user in users if not user.bot}
+        table = self._weight_table(guild, settings)
+        weights = {}
+        for voters in fetched.values():
+            for user_id in voters:
+                if user_id not in weights:
+                    weights[user_id] = table.weight(guild.get_member(user_id))
+        for vote in votes:
+            positive_react, negative_react = self._vote_reacts(vote, settings)
+            # an emoji missing from the message means every vote for it was removed
+            vote = await self.votes.set_voters(
+                vote.key,
+                fetched.get(emoji_key(positive_react), set()),
+                fetched.get(emoji_key(negative_react), set()),
+                weights,
+            )
+            # votes that finished from live reactions while we were fetching are left alone
+            if vote is None:
+                continue
+            try:
+                await self._check_vote(vote, settings)
+            except discord.HTTPException:
+                pass
+
+    async def _track_votes(self, votes: List[PendingVote]) -> None:
+        evicted = await self.votes.add(votes)
+        self.metrics.incr("votes_opened", len(votes))
+        self.metrics.incr("votes_dropped", len(evicted))
+        for vote in votes:
+            self.audit.record("opened", vote.guild_id, vote.member_id, vote.message_id)
+        for old_vote in evicted:
+            log.info(
+                "Too many open votes, dropped vote for member %s on message %s",
+                old_vote.member_id,
+                old_vote.message_id,
+            )
+
+    @staticmethod
+    def _vote_reacts(vote: PendingVote, settings: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        The (positive, negative) reactions counted for a vote.
+        """
+        if vote.slot:
+            return DIGEST_NUMBERS[vote.slot - 1], DIGEST_LETTERS[vote.slot - 1]
+        return settings["POSITIVE_REACT"], settings["NEGATIVE_REACT"]
+
+    async def _match_reaction(
+        self, payload: discord.raw_models.RawReactionActionEvent
+    ) -> Tuple[Optional[PendingVote], bool]:
+        """
+        The open vote a reaction counts towards, and whether it is a vote for the member.
+        Reactions that can't be a vote are dropped before anything is awaited.
+        """
+        if payload.user_id == self.bot.user.id:
+            return None, False
+        member = getattr(payload, "member", None)
+        if member is not None and member.bot:
+            return None, False
+        key = emoji_key(payload.emoji)
+        digest_react = DIGEST_REACTS.get(key)
+        reacts = self._reacts.get(payload.guild_id)
+        if reacts is not None and digest_react is None and key not in reacts:
+            return None, False
+        votes = await self._backend()
+        if reacts is None:
+            # only a shared backend can hold votes of a guild whose settings aren't loaded yet
+            guild = self.bot.get_guild(payload.guild_id) if votes.shared else None
+            if guild is None:
+                return None, False
+            await self._get_settings(guild)
+            reacts = self._reacts[guild.id]
+        if digest_react is not None:
+            slot, positive = digest_react
+            vote = await votes.get((payload.message_id, slot))
+            if vote is not None and not vote.finishing:
+                return vote, positive
+        positive = reacts.get(key)
+        if positive is None:
+            return None, False
+        vote = await votes.get((payload.message_id, 0))
+        if vote is None or vote.finishing:
+            return None, False
+        return vote, positive
+
+    async def _expire_votes(self) -> None:
+        votes = await self._backend()
+        while True:
+            await asyncio.sleep(EXPIRY_INTERVAL)
+            try:
+                expired = await votes.expire(time.time())
+            except Exception:
+                log.error("Error removing expired votes", exc_info=True)
+                continue
+            self.metrics.incr("votes_dropped", len(expired))
+            for vote in expired:
+                log.info("Vote for member %s on message %s expired", vote.member_id, vote.message_id)
+                self.audit.record("expired", vote.guild_id, vote.member_id, vote.message_id)
+
+    async def _set_setting(self, guild: discord.Guild, key: str, value: Any) -> None:
+        """
+        Write a setting to Config and update the in-memory snapshot in place.
+        """
+        with self.metrics.io("config"):
+            await self.config.guild(guild).get_attr(key).set(value)
+        settings = self._settings.get(guild.id)
+        if settings is not None:
+            settings[key] = value
+            self._update_derived(guild.id, settings)
+            self._trace_settings(guild.id)
+
+    async def _set_template(self, ctx: commands.Context, key: str, message: str) -> bool:
+        """
+        Check a message template and save it, tells the user what's wrong if it can't be used.
+        """
+        try:
+            Template(message, TEMPLATE_FIELDS[key])
+        except ValueError as e:
+            await ctx.send(str(e))
+            return False
+        await self._set_setting(ctx.message.guild, key, message)
+        return True
 
     async def _no_perms(self, channel: Optional[discord.TextChannel] = None) -> None:
         m = (
@@ -76,55 +450,133 @@ class VoteMember(commands.Cog):
         guild = member.guild
         self.last_guild = guild
         # await self._verify_json(None)
-        positive_react = await self.config.guild(guild).POSITIVE_REACT()
-        negative_react = await self.config.guild(guild).NEGATIVE_REACT()
-        roles = await self.config.guild(guild).ROLE()
+        settings = await self._get_settings(guild)
+        positive_react = settings["POSITIVE_REACT"]
+        negative_react = settings["NEGATIVE_REACT"]
 
-        ch = cast(
-            discord.TextChannel, guild.get_channel(await self.config.guild(guild).AGREE_CHANNEL())
+        ch = cast(discord.TextChannel, guild.get_channel(settings["AGREE_CHANNEL"]))
+        msg = self._templates[guild.id]["AGREE_MSG"].render(
+            mention=member.mention, roles=self._role_index(guild, settings).mentions
         )
-        msg = await self.config.guild(guild).AGREE_MSG()
-        if msg is None:
-            msg = "{mention} wants to join the {roles} party"
+
         try:
-            msg = msg.format(
-                mention=member.mention,
-                roles=", ".join(role.mention for role in guild.roles if role.id in roles),
+            with self.metrics.io("discord"):
+                msg = await ch.send(msg)
+                await msg.add_reaction(positive_react)
+                if settings["NEGATIVE_NEEDED"] > 0:
+                    await msg.add_reaction(negative_react)
+        except discord.HTTPException:
+            return
+        ttl = settings["VOTE_TTL"]
+        vote = PendingVote(
+            msg.id, ch.id, guild.id, member.id, expires_at=time.time() + ttl if ttl else None
+        )
+        await self._track_votes([vote])
+
+    def _join_burst(self, guild: discord.Guild, settings: Dict[str, Any]) -> bool:
+        """
+        Record a join and tell whether the guild is over the digest threshold.
+        """
+        threshold = settings["DIGEST_THRESHOLD"]
+        if not threshold:
+            return False
+        now = time.monotonic()
+        joins = self._joins.setdefault(guild.id, deque())
+        joins.append(now)
+        while joins[0] <= now - settings["DIGEST_WINDOW"]:
+            joins.popleft()
+        return len(joins) > threshold
+
+    async def _queue_digest(self, member: discord.Member, settings: Dict[str, Any]) -> None:
+        guild = member.guild
+        pending = self._digest_members.setdefault(guild.id, [])
+        if any(waiting.id == member.id for waiting in pending):
+            return
+        pending.append(member)
+        if len(pending) >= DIGEST_SIZE:
+            await self._send_digest(guild)
+        elif guild.id not in self._digest_tasks:
+            self._digest_tasks[guild.id] = self.bot.loop.create_task(
+                self._send_digest_later(guild, settings["DIGEST_WINDOW"])
             )
-        except Exception:
-            log.error("Error formatting agreement message", exc_info=True)
 
+    async def _send_digest_later(self, guild: discord.Guild, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._digest_tasks.pop(guild.id, None)
+        while self._digest_members.get(guild.id):
+            await self._send_digest(guild)
+
+    async def _send_digest(self, guild: discord.Guild) -> None:
+        """
+        Post one agreement message for up to DIGEST_SIZE waiting members.
+        No reactions are added, voters react with the member's number or letter themselves.
+        """
+        pending = self._digest_members.get(guild.id, [])
+        members, pending[:] = pending[:DIGEST_SIZE], pending[DIGEST_SIZE:]
+        members = [member for member in members if guild.get_member(member.id) is not None]
+        if not members:
+            return
+        settings = await self._get_settings(guild)
+        ch = cast(discord.TextChannel, guild.get_channel(settings["AGREE_CHANNEL"]))
+        negative = settings["NEGATIVE_NEEDED"] > 0
+        lines = [
+            "These members want to join the {roles} party:".format(
+                roles=self._role_index(guild, settings).mentions
+            )
+        ]
+        for slot, member in enumerate(members, 1):
+            if negative:
+                lines.append(f"{DIGEST_NUMBERS[slot - 1]} / {DIGEST_LETTERS[slot - 1]} {member.mention}")
+            else:
+                lines.append(f"{DIGEST_NUMBERS[slot - 1]} {member.mention}")
+        if negative:
+            lines.append("React with a member's number to vote for them, or their letter to vote against them.")
+        else:
+            lines.append("React with a member's number to vote for them.")
         try:
-            msg = await ch.send(msg)
-            await msg.add_reaction(positive_react)
-            if await self.config.guild(guild).NEGATIVE_NEEDED() > 0:
-                await msg.add_reaction(negative_react)
+            with self.metrics.io("discord"):
+                msg = await ch.send("\n".join(lines))
         except discord.HTTPException:
             return
-        self.messages[msg.id] = {"msg": msg, "member": member.id, "positive": set(), "negative": set()}
+        ttl = settings["VOTE_TTL"]
+        expires_at = time.time() + ttl if ttl else None
+        await self._track_votes(
+            [
+                PendingVote(msg.id, ch.id, guild.id, member.id, expires_at=expires_at, slot=slot)
+                for slot, member in enumerate(members, 1)
+            ]
+        )
 
     async def _auto_give(self, member: discord.Member) -> None:
         guild = member.guild
-        roles_id = await self.config.guild(guild).ROLE()
-        roles = [role for role in guild.roles if role.id in roles_id]
+        roles_id = (await self._get_settings(guild))["ROLE"]
         if not guild.me.guild_permissions.manage_roles:
             await self._no_perms()
             return
-        for role in roles:
-            await member.add_roles(member.guild.get_role(role), reason="Joined the server")
+        self.role_queue.enqueue(member, roles_id, reason="Joined the server")
 
-    async def _add_member_from_message(self, reaction_msg, add: bool) -> None:
-        message = self.messages[reaction_msg]["msg"]
-        guild = message.guild
-        member = guild.get_member(self.messages[reaction_msg]["member"])
-        roles = await self.config.guild(guild).ROLE()
+    @timed("add_member_from_message")
+    async def _add_member_from_message(self, vote: PendingVote, add: bool) -> bool:
+        """
+        Apply the outcome of a claimed vote, returns whether the vote was closed.
+
+        Clearing the reactions, granting the roles and announcing the result run
+        concurrently, except that the announcement waits for the roles to be granted.
+        Steps that fail are logged on their own and don't stop the others.
+        """
+        guild = self.bot.get_guild(vote.guild_id)
+        channel = guild.get_channel(vote.channel_id)
+        message = channel.get_partial_message(vote.message_id)
+        member = guild.get_member(vote.member_id)
+        mention = member.mention if member is not None else f"<@{vote.member_id}>"
+        settings = await self._get_settings(guild)
+        roles = settings["ROLE"]
 
-        positive_react = await self.config.guild(guild).POSITIVE_REACT()
-        negative_react = await self.config.guild(guild).NEGATIVE_REACT()
+        positive_react, negative_react = self._vote_reacts(vote, settings)
 
-        roles_str = ", ".join(role.mention for role in guild.roles if role.id in roles)
+        roles_str = self._role_index(guild, settings).mentions
 
-        people = self.messages[reaction_msg]["positive" if add else "negative"]
+        people = vote.positive if add else vote.negative
         people = [guild.get_member(person) for person in people]
         people = list(filter(None, people))
         people_str = "Unknown"
@@ -132,91 +584,196 @@ class VoteMember(commands.Cog):
             people_str = ", ".join(
             [person.mention if hasattr(person, "mention") else person.name for person in people])
 
+        if add and not guild.me.guild_permissions.manage_roles:
+            await self._no_perms()
+            return False
+
+        async def clear(emoji: str) -> None:
+            try:
+                with self.metrics.io("discord"):
+                    await message.clear_reaction(emoji)
+            except discord.NotFound:
+                pass
+
+        async def grant() -> bool:
+            if member is None:
+                return False
+            reason = "Voted in by {people}".format(people=people_str)
+            return await self.role_queue.enqueue(member, roles, reason=reason)
 
-        await message.clear_reaction(positive_react)
-        await message.clear_reaction(negative_react)
+        grant_task = self.bot.loop.create_task(grant()) if add else None
 
-        if add:
-            if not guild.me.guild_permissions.manage_roles:
-                await self._no_perms()
+        async def announce() -> None:
+            if grant_task is not None and not await asyncio.shield(grant_task):
+                with self.metrics.io("discord"):
+                    await channel.send(f"{mention} was voted in, but I couldn't give them their roles.")
                 return
-            for role in roles:
-                await member.add_roles(member.guild.get_role(role), reason="Voted in by {people}".format(people=people_str))
+            template = self._templates[guild.id]["VOTE_SUCCEEDED" if add else "VOTE_CANCELLED"]
+            with self.metrics.io("discord"):
+                await channel.send(template.render(mention=mention, roles=roles_str, people=people_str))
 
-        channel = message.channel
-        msg = ""
-        if add:
-            msg = await self.config.guild(guild).VOTE_SUCCEEDED()
-        else:
-            msg = await self.config.guild(guild).VOTE_CANCELLED()
-        msg = msg.format(
-            mention=member.mention,
-            roles=roles_str,
-            people=people_str
+        steps = {"clearing " + positive_react: clear(positive_react), "announcement": announce()}
+        if vote.slot or settings["NEGATIVE_NEEDED"] > 0:
+            steps["clearing " + negative_react] = clear(negative_react)
+        if grant_task is not None:
+            steps["role grant"] = grant_task
+        results = await asyncio.gather(*steps.values(), return_exceptions=True)
+        for step, result in zip(steps, results):
+            if isinstance(result, BaseException) or result is False:
+                log.warning(
+                    "Finishing the vote for member %s: %s failed%s",
+                    vote.member_id,
+                    step,
+                    f" ({result})" if result is not False else "",
+                )
+
+        self.audit.record("voted_in" if add else "voted_out", vote.guild_id, vote.member_id, vote.message_id)
+        if self.trace is not None:
+            self.trace.outcome(vote, add)
+        await self.votes.remove([vote.key])
+        self.metrics.incr("votes_closed")
+        return True
+
+    @staticmethod
+    def _decide(vote: PendingVote, settings: Dict[str, Any]) -> Optional[bool]:
+        return decide(
+            vote.positive_score, vote.negative_score, settings["POSITIVE_NEEDED"], settings["NEGATIVE_NEEDED"]
         )
-        await channel.send(msg)
 
-        self.messages.pop(reaction_msg, None)
+    async def _check_vote(self, vote: PendingVote, settings: Dict[str, Any]) -> None:
+        """
+        Finish the vote once either side has enough reactions.
+        The vote is claimed in the backend first, so concurrent reactions, in this
+        process or another one, can't finish it twice.
+        """
+        if vote.finishing or self._decide(vote, settings) is None:
+            return
+        vote = await self.votes.claim(vote.key)
+        if vote is None:
+            return
+        closed = False
+        try:
+            # decide again on the claimed tally, a vote may have been taken back meanwhile
+            add = self._decide(vote, settings)
+            if add is not None:
+                closed = await self._add_member_from_message(vote, add)
+        finally:
+            # a vote that couldn't be finished stays open, so the next reaction retries
+            if not closed:
+                await self.votes.release(vote.key)
 
     @commands.Cog.listener()
+    @timed("on_member_join")
     async def on_member_join(self, member: discord.Member) -> None:
         guild = member.guild
-        if await self.config.guild(guild).ENABLED():
-            if await self.config.guild(guild).AGREE_CHANNEL() is not None:
-                await self._agree_maker(member)
-            else:  # Immediately give the new user the role
+        settings = await self._get_settings(guild)
+        if self.trace is not None:
+            self.trace.join(member)
+        if settings["ENABLED"]:
+            if settings["AGREE_CHANNEL"] is None:
                 await self._auto_give(member)
+            elif await (await self._backend()).for_member(guild.id, member.id) is not None:
+                # rejoined while their vote is still open, keep voting on the same message
+                return
+            elif self._join_burst(guild, settings):
+                await self._queue_digest(member, settings)
+            else:
+                await self._agree_maker(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        guild = member.guild
+        if self.trace is not None:
+            self.trace.leave(member)
+        pending = self._digest_members.get(guild.id)
+        if pending:
+            pending[:] = [waiting for waiting in pending if waiting.id != member.id]
+        votes = await self._backend()
+        vote = await votes.for_member(guild.id, member.id)
+        if vote is None or vote.finishing:
+            return
+        await votes.remove([vote.key])
+        self.metrics.incr("votes_dropped")
+        self.audit.record("left", vote.guild_id, vote.member_id, vote.message_id)
+        # a digest message still lists other members, a single member message is just noise now
+        if not vote.slot:
+            channel = guild.get_channel(vote.channel_id)
+            if channel is not None:
+                try:
+                    with self.metrics.io("discord"):
+                        await channel.get_partial_message(vote.message_id).delete()
+                except discord.HTTPException:
+                    pass
 
     @commands.Cog.listener()
+    @timed("on_raw_reaction_add")
     async def on_raw_reaction_add(
         self, payload: discord.raw_models.RawReactionActionEvent
     ):
-        if payload.user_id == self.bot.user.id:
+        vote, positive = await self._match_reaction(payload)
+        if vote is not None:
+            guild = self.bot.get_guild(payload.guild_id)
+            settings = await self._get_settings(guild)
+            if not positive and not 0 < settings["NEGATIVE_NEEDED"]:
+                vote = None
+        if vote is None:
+            if self.trace is not None:
+                self.trace.reaction(payload, emoji_key(payload.emoji), True)
             return
 
-        reaction_msg = payload.message_id
-        if reaction_msg not in self.messages:
-            return
-
-        guild = self.bot.get_guild(payload.guild_id)
-        positive_react = await self.config.guild(guild).POSITIVE_REACT()
-        positive_needed = await self.config.guild(guild).POSITIVE_NEEDED()
-        negative_react = await self.config.guild(guild).NEGATIVE_REACT()
-        negative_needed = await self.config.guild(guild).NEGATIVE_NEEDED()
+        member = getattr(payload, "member", None) or guild.get_member(payload.user_id)
+        weight = self._weight_table(guild, settings).weight(member)
+        if self.trace is not None:
+            self.trace.reaction(payload, emoji_key(payload.emoji), True, vote, positive, weight)
 
         try:
+            vote = await self.votes.cast(vote.key, payload.user_id, positive, True, weight)
+            if vote is None:
+                return
+            self.audit.record(
+                "for" if positive else "against", vote.guild_id, vote.member_id, vote.message_id, payload.user_id
+            )
 
-            if str(payload.emoji) == positive_react:
-                self.messages[reaction_msg]["positive"].add(payload.user_id)
-            elif 0 < negative_needed and str(payload.emoji) == negative_react:
-                self.messages[reaction_msg]["negative"].add(payload.user_id)
-
-            if len(self.messages[reaction_msg]["positive"]) >= positive_needed:
-                await self._add_member_from_message(reaction_msg, True)
-            elif 0 < negative_needed <= len(self.messages[reaction_msg]["negative"]):
-                await self._add_member_from_message(reaction_msg, False)
+            await self._check_vote(vote, settings)
         except discord.HTTPException:
             return
 
 
-
     @commands.Cog.listener()
+    @timed("on_raw_reaction_remove")
     async def on_raw_reaction_remove(
         self, payload: discord.raw_models.RawReactionActionEvent
     ):
-        reaction_msg = payload.message_id
-        if reaction_msg not in self.messages:
+        vote, positive = await self._match_reaction(payload)
+        if self.trace is not None:
+            self.trace.reaction(payload, emoji_key(payload.emoji), False, vote, positive)
+        if vote is None:
             return
 
-        guild = self.bot.get_guild(payload.guild_id)
-        positive_react = await self.config.guild(guild).POSITIVE_REACT()
-        negative_react = await self.config.guild(guild).NEGATIVE_REACT()
+        vote = await self.votes.cast(vote.key, payload.user_id, positive, False)
+        if vote is not None:
+            self.audit.record(
+                "retract_for" if positive else "retract_against",
+                vote.guild_id,
+                vote.member_id,
+                vote.message_id,
+                payload.user_id,
+            )
 
-        if str(payload.emoji) == positive_react:
-            self.messages[reaction_msg]["positive"].discard(payload.user_id)
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        index = self._role_indexes.get(after.guild.id)
+        if index is not None and after.id in index.ids:
+            self._role_indexes.pop(after.guild.id, None)
 
-        if str(payload.emoji) == negative_react:
-            self.messages[reaction_msg]["negative"].discard(payload.user_id)
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        index = self._role_indexes.get(role.guild.id)
+        if index is not None and role.id in index.ids:
+            self._role_indexes.pop(role.guild.id, None)
+        table = self._weight_tables.get(role.guild.id)
+        if table is not None and role.id in table.weights:
+            self._weight_tables.pop(role.guild.id, None)
 
     @commands.guild_only()
     @commands.group(name="votemember")
@@ -234,23 +791,33 @@ class VoteMember(commands.Cog):
         Display current votemember info
         """
         guild = ctx.message.guild
-        enabled = await self.config.guild(guild).ENABLED()
-        roles = await self.config.guild(guild).ROLE()
-        msg = await self.config.guild(guild).AGREE_MSG()
+        settings = await self._get_settings(guild)
+        enabled = settings["ENABLED"]
+        msg = settings["AGREE_MSG"]
         if not msg:
             msg = "{mention} wants to join the {roles} party"
-        positive_react = await self.config.guild(guild).POSITIVE_REACT()
-        positive_needed = await self.config.guild(guild).POSITIVE_NEEDED()
-        negative_react = await self.config.guild(guild).NEGATIVE_REACT()
-        negative_needed = await self.config.guild(guild).NEGATIVE_NEEDED()
-        succeeded_msg = await self.config.guild(guild).VOTE_SUCCEEDED()
-        cancelled_msg = await self.config.guild(guild).VOTE_CANCELLED()
-
-        ch_id = await self.config.guild(guild).AGREE_CHANNEL()
+        positive_react = settings["POSITIVE_REACT"]
+        positive_needed = settings["POSITIVE_NEEDED"]
+        negative_react = settings["NEGATIVE_REACT"]
+        negative_needed = settings["NEGATIVE_NEEDED"]
+        succeeded_msg = settings["VOTE_SUCCEEDED"]
+        cancelled_msg = settings["VOTE_CANCELLED"]
+        vote_ttl = settings["VOTE_TTL"]
+        queued_roles = self.role_queue.depth(guild.id)
+        digest_threshold = settings["DIGEST_THRESHOLD"]
+        digest_str = (
+            f"over {digest_threshold} joins in {settings['DIGEST_WINDOW']}s" if digest_threshold else "Off"
+        )
+        weights = self._weight_table(guild, settings).weights
+        weights_str = ", ".join(f"<@&{role_id}>: {weight:g}" for role_id, weight in weights.items())
+        if not weights_str:
+            weights_str = "Everyone counts 1"
+
+        ch_id = settings["AGREE_CHANNEL"]
         channel = guild.get_channel(ch_id)
         chn_name = channel.name if channel is not None else "None"
         chn_mention = channel.mention if channel is not None else "None"
-        role_name_str = ", ".join(role.mention for role in guild.roles if role.id in roles)
+        role_name_str = self._role_index(guild, settings).mentions
         if not role_name_str:
             role_name_str = "None"
         if ctx.channel.permissions_for(ctx.me).embed_links:
@@ -266,6 +833,10 @@ class VoteMember(commands.Cog):
             embed.add_field(name="Agreement channel: ", value=str(chn_mention))
             embed.add_field(name="Succeeded msg: ", value=str(succeeded_msg))
             embed.add_field(name="cancelled msg: ", value=str(cancelled_msg))
+            embed.add_field(name="Vote TTL (hours): ", value=str(vote_ttl / 3600 if vote_ttl else "Never"))
+            embed.add_field(name="Queued role grants: ", value=str(queued_roles))
+            embed.add_field(name="Digest mode: ", value=digest_str)
+            embed.add_field(name="Vote weights: ", value=weights_str)
             await ctx.send(embed=embed)
         else:
             send_msg = (
@@ -290,11 +861,192 @@ class VoteMember(commands.Cog):
                 + f"{succeeded_msg}"
                 + "Cancelled msg: "
                 + f"{cancelled_msg}"
+                + "Vote TTL (hours): "
+                + f"{vote_ttl / 3600 if vote_ttl else 'Never'}"
+                + "Queued role grants: "
+                + f"{queued_roles}"
+                + "Digest mode: "
+                + f"{digest_str}"
+                + "Vote weights: "
+                + f"{weights_str}"
                 + "```"
             )
             await ctx.send(send_msg)
 
 
+    @votemember.command(name="pending")
+    async def votemember_pending(self, ctx: commands.Context) -> None:
+        """
+        List the votes that are still open
+        """
+        guild = ctx.message.guild
+        votes = await (await self._backend()).in_guild(guild.id)
+        if not votes:
+            await ctx.send("There are no open votes.")
+            return
+        settings = await self._get_settings(guild)
+        use_embeds = ctx.channel.permissions_for(ctx.me).embed_links
+        lines = []
+        for vote in votes:
+            link = f"https://discord.com/channels/{vote.guild_id}/{vote.channel_id}/{vote.message_id}"
+            line = (
+                f"<@{vote.member_id}>: {vote.positive_score:g}/{settings['POSITIVE_NEEDED']} for, "
+                f"{vote.negative_score:g}/{settings['NEGATIVE_NEEDED']} against, "
+                + (f"[agreement message]({link})" if use_embeds else link)
+            )
+            if vote.expires_at is not None:
+                line += f", expires <t:{int(vote.expires_at)}:R>"
+            lines.append(line)
+        chunks = [lines[i : i + PENDING_PAGE_SIZE] for i in range(0, len(lines), PENDING_PAGE_SIZE)]
+        pages = []
+        for number, chunk in enumerate(chunks, 1):
+            footer = f"{len(votes)} open votes, page {number}/{len(chunks)}"
+            if use_embeds:
+                embed = discord.Embed(colour=await self.get_colour(ctx.channel), description="\n".join(chunk))
+                embed.set_author(name="Open votes in " + guild.name)
+                embed.set_footer(text=footer)
+                pages.append(embed)
+            else:
+                pages.append("\n".join(chunk) + "\n" + footer)
+        await menu(ctx, pages, DEFAULT_CONTROLS)
+
+    @votemember.command(name="history")
+    @checks.admin_or_permissions(manage_roles=True)
+    async def votemember_history(self, ctx: commands.Context, user: discord.User = None) -> None:
+        """
+        Show who voted on whom and how votes ended
+        Give a user to only see the votes on them.
+        """
+        guild = ctx.message.guild
+        events = await self.audit.history(guild.id, user.id if user is not None else None, HISTORY_LIMIT)
+        if not events:
+            await ctx.send("There is no vote history yet.")
+            return
+        lines = []
+        for event in events:
+            text = EVENTS[event.event].format(
+                member=f"<@{event.member_id}>", voter=f"<@{event.voter_id}>"
+            )
+            lines.append(f"<t:{int(event.at)}:f> {text}")
+        use_embeds = ctx.channel.permissions_for(ctx.me).embed_links
+        chunks = [lines[i : i + HISTORY_PAGE_SIZE] for i in range(0, len(lines), HISTORY_PAGE_SIZE)]
+        title = "Vote history of " + (str(user) if user is not None else guild.name)
+        pages = []
+        for number, chunk in enumerate(chunks, 1):
+            footer = f"{len(events)} latest events, page {number}/{len(chunks)}"
+            if use_embeds:
+                embed = discord.Embed(colour=await self.get_colour(ctx.channel), description="\n".join(chunk))
+                embed.set_author(name=title)
+                embed.set_footer(text=footer)
+                pages.append(embed)
+            else:
+                pages.append(title + "\n" + "\n".join(chunk) + "\n" + footer)
+        await menu(ctx, pages, DEFAULT_CONTROLS)
+
+    @votemember.group(name="stats", invoke_without_command=True)
+    async def votemember_stats(self, ctx: commands.Context) -> None:
+        """
+        Show how long the votemember handlers take and how many votes were opened, closed and dropped
+        Times are in milliseconds, `.config` and `.discord` rows are the part of a handler
+        spent waiting on Config and on the Discord API.
+        """
+        metrics = self.metrics
+        counters = ", ".join(f"{name} {count}" for name, count in sorted(metrics.counters.items()))
+        lines = [
+            f"Since <t:{int(metrics.since)}:f>, timing is {'on' if metrics.enabled else 'off'}",
+            "Counters: " + (counters or "none yet"),
+        ]
+        rows = metrics.summary()
+        if rows:
+            width = max(len(row[0]) for row in rows)
+            table = [f"{'':{width}}  {'count':>7} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"]
+            for name, count, *times in rows:
+                table.append(f"{name:{width}}  {count:>7} " + " ".join(f"{ms:>8.2f}" for ms in times))
+            lines.append(box("\n".join(table)))
+        elif not metrics.enabled:
+            lines.append("Turn timing on with `votemember stats toggle`.")
+        for page in pagify("\n".join(lines), shorten_by=10):
+            await ctx.send(page)
+
+    @votemember_stats.command(name="toggle")
+    @checks.is_owner()
+    async def votemember_stats_toggle(self, ctx: commands.Context) -> None:
+        """
+        Turn handler timing on or off
+        """
+        enabled = not self.metrics.enabled
+        await self.config.METRICS.set(enabled)
+        self.metrics.enabled = enabled
+        await ctx.send("Handler timing is now " + ("on." if enabled else "off."))
+
+    @votemember_stats.command(name="reset")
+    @checks.is_owner()
+    async def votemember_stats_reset(self, ctx: commands.Context) -> None:
+        """
+        Clear the collected timings and counters
+        """
+        self.metrics.reset()
+        await ctx.send("Stats cleared.")
+
+    @votemember.group(name="trace")
+    @checks.is_owner()
+    async def votemember_trace(self, ctx: commands.Context) -> None:
+        """
+        Record the joins and reactions votemember sees, for replaying them later
+        Ids are replaced in the trace, so it can be shared without naming anyone.
+        """
+        pass
+
+    @votemember_trace.command(name="start")
+    async def votemember_trace_start(self, ctx: commands.Context) -> None:
+        """
+        Start recording to a new trace file
+        """
+        if self.trace is not None:
+            await ctx.send(f"Already recording to `{self.trace.path.name}`.")
+            return
+        folder = cog_data_path(self) / "traces"
+        folder.mkdir(exist_ok=True)
+        path = folder / time.strftime("trace-%Y%m%d-%H%M%S.jsonl.gz")
+        self.trace = TraceRecorder(self.bot, path)
+        for guild_id in self._settings:
+            self._trace_settings(guild_id)
+        await ctx.send(f"Recording votemember events to `{path}`.")
+
+    @votemember_trace.command(name="stop")
+    async def votemember_trace_stop(self, ctx: commands.Context) -> None:
+        """
+        Stop recording and close the trace file
+        """
+        trace = self.trace
+        if trace is None:
+            await ctx.send("Nothing is being recorded.")
+            return
+        self.trace = None
+        trace.close()
+        await ctx.send(f"Recorded {trace.events} events to `{trace.path}`.")
+
+    @votemember.command(name="backend")
+    @checks.is_owner()
+    async def votemember_backend(self, ctx: commands.Context, backend: str = None) -> None:
+        """
+        Show or set where open votes are kept
+        `memory` keeps them in this process and copies them to disk.
+        `sqlite` keeps them only on disk, so bot processes on one machine share them.
+        Both use the same file, so open votes carry over.
+        Takes effect when the cog is reloaded.
+        """
+        current = await self.config.VOTE_BACKEND()
+        if backend is None:
+            await ctx.send(f"Open votes are kept in the {current} backend.")
+            return
+        backend = backend.lower()
+        if backend not in BACKENDS:
+            await ctx.send("The backend must be one of: " + ", ".join(BACKENDS))
+            return
+        await self.config.VOTE_BACKEND.set(backend)
+        await ctx.send(f"Open votes will be kept in the {backend} backend once the cog is reloaded.")
+
     @votemember.command()
     @checks.admin_or_permissions(manage_roles=True)
     async def toggle(self, ctx: commands.Context) -> None:
@@ -302,18 +1054,19 @@ class VoteMember(commands.Cog):
         Enables/Disables votemember
         """
         guild = ctx.message.guild
-        if await self.config.guild(guild).ROLE() is None:
+        settings = await self._get_settings(guild)
+        if settings["ROLE"] is None:
             msg = "You haven't set a role to give to new users!"
             await ctx.send(msg)
-        elif await self.config.guild(guild).AGREE_CHANNEL() is None:
+        elif settings["AGREE_CHANNEL"] is None:
             msg = "You haven't set a channel which will be used!"
             await ctx.send(msg)
         else:
-            if await self.config.guild(guild).ENABLED():
-                await self.config.guild(guild).ENABLED.set(False)
+            if settings["ENABLED"]:
+                await self._set_setting(guild, "ENABLED", False)
                 await ctx.send("Votemember is now disabled.")
             else:
-                await self.config.guild(guild).ENABLED.set(True)
+                await self._set_setting(guild, "ENABLED", True)
                 await ctx.send("Votemember is now enabled.")
 
 
@@ -325,7 +1078,7 @@ class VoteMember(commands.Cog):
         You can use this command multiple times to add multiple roles.
         """
         guild = ctx.message.guild
-        roles = await self.config.guild(guild).ROLE()
+        roles = list((await self._get_settings(guild))["ROLE"])
         if ctx.author.top_role < role:
             msg = (
                 " is higher than your highest role. "
@@ -340,7 +1093,7 @@ class VoteMember(commands.Cog):
             await ctx.send(role.name + msg)
             return
         roles.append(role.id)
-        await self.config.guild(guild).ROLE.set(roles)
+        await self._set_setting(guild, "ROLE", roles)
         await ctx.send(role.name + " role added to the votemember.")
 
     @votemember.command()
@@ -350,14 +1103,77 @@ class VoteMember(commands.Cog):
         Remove a role from the votemember.
         """
         guild = ctx.message.guild
-        roles = await self.config.guild(guild).ROLE()
+        roles = list((await self._get_settings(guild))["ROLE"])
         if role.id not in roles:
             await ctx.send(role.name + " is not in the votemember list.")
             return
         roles.remove(role.id)
-        await self.config.guild(guild).ROLE.set(roles)
+        await self._set_setting(guild, "ROLE", roles)
         await ctx.send(role.name + " role removed from the votemember.")
 
+    @votemember.command()
+    @checks.admin_or_permissions(manage_roles=True)
+    async def ttl(self, ctx: commands.Context, hours: float) -> None:
+        """
+        Set how many hours a vote stays open before it is dropped.
+        Use 0 to keep votes open until they finish.
+        """
+        guild = ctx.message.guild
+        if hours < 0:
+            await ctx.send("The vote TTL can't be negative.")
+            return
+        await self._set_setting(guild, "VOTE_TTL", int(hours * 3600))
+        if hours:
+            await ctx.send(f"Votes will now expire after {hours:g} hours.")
+        else:
+            await ctx.send("Votes will now stay open until they finish.")
+
+    @votemember.command()
+    @checks.admin_or_permissions(manage_roles=True)
+    async def digest(self, ctx: commands.Context, threshold: int, window: int = 10) -> None:
+        """
+        Group agreement messages during join waves.
+        Once more than `threshold` members join within `window` seconds, further joins
+        are collected for `window` seconds and posted as one numbered message of up to 10 members.
+        Use a threshold of 0 to always post one message per member.
+        """
+        guild = ctx.message.guild
+        if threshold < 0 or window <= 0:
+            await ctx.send("The threshold can't be negative and the window must be at least a second.")
+            return
+        await self._set_setting(guild, "DIGEST_THRESHOLD", threshold)
+        await self._set_setting(guild, "DIGEST_WINDOW", window)
+        if threshold:
+            await ctx.send(
+                f"Joins will be grouped into digests after {threshold} joins in {window} seconds."
+            )
+        else:
+            await ctx.send("Digest mode disabled.")
+
+    @votemember.command()
+    @checks.admin_or_permissions(manage_roles=True)
+    async def weight(self, ctx: commands.Context, role: discord.Role, weight: float = None) -> None:
+        """
+        Set how much a vote from members with `role` counts.
+        Members count as much as their highest weighted role, everyone else counts 1.
+        The needed positive and negative counts are compared against these weighted sums.
+        Entering no weight makes the role count 1 again.
+        """
+        guild = ctx.message.guild
+        if weight is not None and weight < 0:
+            await ctx.send("A vote weight can't be negative.")
+            return
+        weights = dict((await self._get_settings(guild))["VOTE_WEIGHTS"])
+        if weight is None:
+            weights.pop(str(role.id), None)
+        else:
+            weights[str(role.id)] = weight
+        await self._set_setting(guild, "VOTE_WEIGHTS", weights)
+        if weight is None:
+            await ctx.send(f"Votes from {role.name} count 1 again.")
+        else:
+            await ctx.send(f"Votes from {role.name} now count {weight:g}.")
+
     @votemember.group()
     @checks.admin_or_permissions(manage_roles=True)
     async def agreement(self, ctx: commands.Context) -> None:
@@ -377,16 +1193,17 @@ class VoteMember(commands.Cog):
         Entering nothing will clear this.
         """
         guild = ctx.message.guild
-        if await self.config.guild(guild).ROLE() == []:
+        settings = await self._get_settings(guild)
+        if settings["ROLE"] == []:
             await ctx.send("No roles have been set for votemember.")
             return
-        if not await self.config.guild(guild).ENABLED():
+        if not settings["ENABLED"]:
             await ctx.send("Votemember is disabled, don't forget to enable it afterwards :)")
         if channel is None:
-            await self.config.guild(guild).AGREE_CHANNEL.set(None)
+            await self._set_setting(guild, "AGREE_CHANNEL", None)
             await ctx.send("Agreement channel cleared")
         else:
-            await self.config.guild(guild).AGREE_CHANNEL.set(channel.id)
+            await self._set_setting(guild, "AGREE_CHANNEL", channel.id)
             await ctx.send("Agreement channel set to " + channel.mention)
 
     @agreement.command(name="message", aliases=["msg"])
@@ -399,16 +1216,16 @@ class VoteMember(commands.Cog):
         Entering nothing will clear this to default.
         """
         guild = ctx.message.guild
-        if await self.config.guild(guild).ROLE() == []:
+        settings = await self._get_settings(guild)
+        if settings["ROLE"] == []:
             await ctx.send("No roles have been set for votemember.")
             return
-        if not await self.config.guild(guild).ENABLED():
+        if not settings["ENABLED"]:
             await ctx.send("Votemember is disabled, don't forget to enable it afterwards :)")
         if message is None:
-            await self.config.guild(guild).AGREE_MSG.set(None)
+            await self._set_setting(guild, "AGREE_MSG", None)
             await ctx.send("Agreement message cleared")
-        else:
-            await self.config.guild(guild).AGREE_MSG.set(message)
+        elif await self._set_template(ctx, "AGREE_MSG", message):
             await ctx.send("Agreement message set to " + message)
 
     @agreement.command(name="setup")
@@ -417,9 +1234,9 @@ class VoteMember(commands.Cog):
         self,
         ctx: commands.Context,
         channel: discord.TextChannel = None,
-        positive: str = ":white_check_mark:",
+        positive: str = "✅",
         pcount: int = 3,
-        negative: str = ":x:",
+        negative: str = "❌",
         ncount: int = 1,
         msg: str = "{mention} wants to join the {roles} party",
     ) -> None:
@@ -434,27 +1251,29 @@ class VoteMember(commands.Cog):
         Entering nothing will clear settings and disable votemember.
         """
         guild = ctx.message.guild
-        if await self.config.guild(guild).ROLE() == []:
+        settings = await self._get_settings(guild)
+        if settings["ROLE"] == []:
             await ctx.send("No roles have been set for votemember.")
             return
-        if not await self.config.guild(guild).ENABLED():
+        if not settings["ENABLED"]:
             await ctx.send("Votemember is disabled, don't forget to enable it afterwards :)")
         if channel is None:
-            await self.config.guild(guild).ENABLED.set(False)
-            await self.config.guild(guild).AGREE_CHANNEL.set(None)
-            await self.config.guild(guild).AGREE_MSG.set("{mention} wants to join the {roles} party")
-            await self.config.guild(guild).POSITIVE_REACT.set("✅")
-            await self.config.guild(guild).POSITIVE_NEEDED.set(3)
-            await self.config.guild(guild).NEGATIVE_REACT.set("❌")
-            await self.config.guild(guild).NEGATIVE_NEEDED.set(1)
+            await self._set_setting(guild, "ENABLED", False)
+            await self._set_setting(guild, "AGREE_CHANNEL", None)
+            await self._set_setting(guild, "AGREE_MSG", "{mention} wants to join the {roles} party")
+            await self._set_setting(guild, "POSITIVE_REACT", "✅")
+            await self._set_setting(guild, "POSITIVE_NEEDED", 3)
+            await self._set_setting(guild, "NEGATIVE_REACT", "❌")
+            await self._set_setting(guild, "NEGATIVE_NEEDED", 1)
             await ctx.send("Settings cleared and votemember disabled")
         else:
-            await self.config.guild(guild).AGREE_CHANNEL.set(channel.id)
-            await self.config.guild(guild).AGREE_MSG.set(msg)
-            await self.config.guild(guild).POSITIVE_REACT.set(positive)
-            await self.config.guild(guild).POSITIVE_NEEDED.set(pcount)
-            await self.config.guild(guild).NEGATIVE_REACT.set(negative)
-            await self.config.guild(guild).NEGATIVE_NEEDED.set(ncount)
+            if not await self._set_template(ctx, "AGREE_MSG", msg):
+                return
+            await self._set_setting(guild, "AGREE_CHANNEL", channel.id)
+            await self._set_setting(guild, "POSITIVE_REACT", positive)
+            await self._set_setting(guild, "POSITIVE_NEEDED", pcount)
+            await self._set_setting(guild, "NEGATIVE_REACT", negative)
+            await self._set_setting(guild, "NEGATIVE_NEEDED", ncount)
             await ctx.send("Agreement channel set to " + channel.mention)
 
 
@@ -476,10 +1295,10 @@ class VoteMember(commands.Cog):
         `{people}` Who voted positively
         Entering nothing will clear this to default.
         """
-        guild = ctx.message.guild
         if message == None:
             message = "Voting successful, user {mention} was awarded role {roles} by users {people}"
-        await self.config.guild(guild).VOTE_SUCCEEDED.set(message)
+        if await self._set_template(ctx, "VOTE_SUCCEEDED", message):
+            await ctx.send("Success message set to " + message)
 
 
     @response.command(name="cancelled")
@@ -492,7 +1311,7 @@ class VoteMember(commands.Cog):
         `{people}` Who voted positively
         Entering nothing will clear this to default.
         """
-        guild = ctx.message.guild
         if message == None:
             message = "Voting of {mention} cancelled by users {people}"
-        await self.config.guild(guild).VOTE_CANCELLED.set(message)
\ No newline at end of file
+        if await self._set_template(ctx, "VOTE_CANCELLED", message):
+            await ctx.send("Cancellation message set to " + message)
\ No newline at end of file
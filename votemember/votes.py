@@ -0,0 +1,212 @@
+import heapq
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# (agreement message id, slot), the slot is 0 for a single member message
+# and the member's number on a digest message
+VoteKey = Tuple[int, int]
+
+
+class PendingVote:
+    """
+    A vote that is still waiting for enough reactions.
+    Only ids are kept, the agreement message is fetched when the vote finishes.
+
+    The weighted score of each side is kept as a running sum, so casting or
+    taking back a vote doesn't go over the other voters.
+    """
+
+    __slots__ = (
+        "message_id",
+        "channel_id",
+        "guild_id",
+        "member_id",
+        "slot",
+        "positive",
+        "negative",
+        "expires_at",
+        "finishing",
+        "weights",
+        "positive_score",
+        "negative_score",
+    )
+
+    def __init__(
+        self,
+        message_id: int,
+        channel_id: int,
+        guild_id: int,
+        member_id: int,
+        expires_at: Optional[float] = None,
+        positive: Optional[Set[int]] = None,
+        negative: Optional[Set[int]] = None,
+        slot: int = 0,
+        weights: Optional[Dict[int, float]] = None,
+    ):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.slot = slot
+        self.expires_at = expires_at
+        self.positive: Set[int] = positive if positive is not None else set()
+        self.negative: Set[int] = negative if negative is not None else set()
+        # set while the vote's outcome is being applied
+        self.finishing = False
+        self.reset(self.positive, self.negative, weights)
+
+    def __repr__(self) -> str:
+        return (
+            f"<PendingVote message_id={self.message_id} member_id={self.member_id} "
+            f"positive={len(self.positive)} negative={len(self.negative)}>"
+        )
+
+    @property
+    def key(self) -> VoteKey:
+        return self.message_id, self.slot
+
+    def weight(self, user_id: int) -> float:
+        return self.weights.get(user_id, 1.0) if self.weights else 1.0
+
+    def cast(self, user_id: int, positive: bool, add: bool, weight: float = 1.0) -> bool:
+        """
+        Add or take back one vote and update the score of its side, returns whether anything changed.
+        A voter keeps the weight they had when they first voted, so taking back a vote
+        subtracts exactly what was added.
+        """
+        voters = self.positive if positive else self.negative
+        if add:
+            if user_id in voters:
+                return False
+            if user_id in self.positive or user_id in self.negative:
+                weight = self.weight(user_id)
+            elif weight != 1.0:
+                # only unusual weights are kept, most votes count 1
+                if self.weights is None:
+                    self.weights = {}
+                self.weights[user_id] = weight
+            voters.add(user_id)
+            delta = weight
+        else:
+            if user_id not in voters:
+                return False
+            voters.discard(user_id)
+            delta = -self.weight(user_id)
+            if self.weights and user_id not in self.positive and user_id not in self.negative:
+                self.weights.pop(user_id, None)
+                if not self.weights:
+                    self.weights = None
+        if positive:
+            self.positive_score = self.positive_score + delta if self.positive else 0.0
+        else:
+            self.negative_score = self.negative_score + delta if self.negative else 0.0
+        return True
+
+    def reset(self, positive: Set[int], negative: Set[int], weights: Optional[Dict[int, float]] = None) -> None:
+        """
+        Replace both sides at once and add the scores up from scratch.
+        """
+        self.positive = positive
+        self.negative = negative
+        self.weights = {
+            user_id: weight
+            for user_id, weight in (weights or {}).items()
+            if weight != 1.0 and (user_id in positive or user_id in negative)
+        } or None
+        self.positive_score = float(sum(map(self.weight, positive)))
+        self.negative_score = float(sum(map(self.weight, negative)))
+
+
+class VoteStore:
+    """
+    Pending votes keyed by agreement message id and slot.
+
+    Votes with an expiry time are tracked in a heap so expired votes can be
+    dropped without scanning the whole store. Once `max_size` votes are open
+    the oldest vote is evicted to make room for a new one. A second index
+    finds the vote on a member without a scan.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # dicts keep insertion order, so the first key is always the oldest vote
+        self._votes: Dict[VoteKey, PendingVote] = {}
+        self._expiry: List[Tuple[float, VoteKey]] = []
+        # guild id -> member id -> key of the vote on that member
+        self._by_member: Dict[int, Dict[int, VoteKey]] = {}
+
+    def __contains__(self, key: VoteKey) -> bool:
+        return key in self._votes
+
+    def __len__(self) -> int:
+        return len(self._votes)
+
+    def __iter__(self) -> Iterator[PendingVote]:
+        return iter(list(self._votes.values()))
+
+    def get(self, message_id: int, slot: int = 0) -> Optional[PendingVote]:
+        return self._votes.get((message_id, slot))
+
+    def for_member(self, guild_id: int, member_id: int) -> Optional[PendingVote]:
+        key = self._by_member.get(guild_id, {}).get(member_id)
+        return self._votes.get(key) if key is not None else None
+
+    def in_guild(self, guild_id: int) -> List[PendingVote]:
+        """
+        Open votes of one guild, oldest first.
+        """
+        keys = sorted(self._by_member.get(guild_id, {}).values())
+        return [self._votes[key] for key in keys]
+
+    def _index(self, vote: PendingVote) -> None:
+        self._by_member.setdefault(vote.guild_id, {})[vote.member_id] = vote.key
+
+    def _unindex(self, vote: PendingVote) -> None:
+        members = self._by_member.get(vote.guild_id)
+        if members is not None and members.get(vote.member_id) == vote.key:
+            del members[vote.member_id]
+            if not members:
+                del self._by_member[vote.guild_id]
+
+    def add(self, vote: PendingVote) -> List[PendingVote]:
+        """
+        Start tracking a vote, returns the votes evicted to stay under the cap.
+        """
+        evicted = []
+        self.pop(vote.key)
+        while self._votes and len(self._votes) >= self.max_size:
+            evicted.append(self.pop(next(iter(self._votes))))
+        self._votes[vote.key] = vote
+        self._index(vote)
+        if vote.expires_at is not None:
+            heapq.heappush(self._expiry, (vote.expires_at, vote.key))
+        self._compact()
+        return evicted
+
+    def pop(self, key: VoteKey) -> Optional[PendingVote]:
+        vote = self._votes.pop(key, None)
+        if vote is not None:
+            self._unindex(vote)
+        return vote
+
+    def expire(self, now: float) -> List[PendingVote]:
+        """
+        Remove and return every vote whose expiry time is at or before `now`.
+        """
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            vote = self._votes.get(key)
+            # heap entries of votes that already finished are skipped lazily
+            if vote is not None and vote.expires_at == expires_at:
+                expired.append(self.pop(key))
+        return expired
+
+    def _compact(self) -> None:
+        # finished votes leave stale heap entries behind, rebuild once they dominate
+        if len(self._expiry) > 2 * len(self._votes) + 64:
+            self._expiry = [
+                (vote.expires_at, vote.key)
+                for vote in self._votes.values()
+                if vote.expires_at is not None
+            ]
+            heapq.heapify(self._expiry)